@@ -4,8 +4,11 @@ const { getPreviewUrl } = require('spotify-preview-finder');
 
 const app = express();
 const PORT = process.env.PORT || 3001;
+const BATCH_CONCURRENCY = parseInt(process.env.BATCH_CONCURRENCY, 10) || 8;
+const MAX_BATCH_SIZE = 200;
 
 app.use(cors());
+app.use(express.json({ limit: '1mb' }));
 
 app.get('/preview', async (req, res) => {
   const { track, artist } = req.query;
@@ -23,6 +26,44 @@ app.get('/preview', async (req, res) => {
   }
 });
 
+// Resolve many { track, artist } pairs in one request. Lookups run
+// BATCH_CONCURRENCY at a time and each result is written as its own
+// newline-delimited JSON line as soon as it completes, so results arrive out
+// of order. { index, preview: null } means no preview exists; { index, error }
+// means the lookup itself failed.
+app.post('/preview/batch', async (req, res) => {
+  const items = req.body && req.body.items;
+  if (!Array.isArray(items)) {
+    return res.status(400).json({ error: 'Expected a JSON body with an items array.' });
+  }
+  if (items.length > MAX_BATCH_SIZE) {
+    return res.status(400).json({ error: `At most ${MAX_BATCH_SIZE} items per batch.` });
+  }
+
+  res.setHeader('Content-Type', 'application/x-ndjson');
+  let next = 0;
+  const worker = async () => {
+    while (next < items.length) {
+      const index = next++;
+      const { track, artist } = items[index] || {};
+      let result;
+      if (!track || !artist) {
+        result = { index, error: 'Missing track or artist parameter.' };
+      } else {
+        try {
+          const url = await getPreviewUrl({ track, artist });
+          result = { index, preview: url || null };
+        } catch (err) {
+          result = { index, error: err.message || 'Internal server error.' };
+        }
+      }
+      res.write(JSON.stringify(result) + '\n');
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(BATCH_CONCURRENCY, items.length) }, worker));
+  res.end();
+});
+
 app.listen(PORT, () => {
   console.log(`Preview Finder server running on port ${PORT}`);
-}); 
\ No newline at end of file
+});
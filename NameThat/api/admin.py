@@ -1,9 +1,9 @@
 from django.contrib import admin
-from .models import GameSession, GameRound, UserStats
+from .models import GameSession, GameRound, PlaylistCrawl, TrackPreviewStatus
 
 @admin.register(GameSession)
 class GameSessionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'playlist_name', 'total_rounds', 'correct_guesses', 'get_score_percentage', 'created_at', 'is_active']
+    list_display = ['id', 'playlist_name', 'current_round', 'total_rounds', 'correct_guesses', 'get_score_percentage', 'created_at', 'is_active']
     list_filter = ['is_active', 'created_at']
     search_fields = ['playlist_name', 'playlist_id']
     readonly_fields = ['id', 'created_at']
@@ -17,10 +17,16 @@ class GameRoundAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at']
     ordering = ['-created_at']
 
-@admin.register(UserStats)
-class UserStatsAdmin(admin.ModelAdmin):
-    list_display = ['user', 'total_games_played', 'total_rounds_played', 'best_score_percentage', 'last_played']
-    list_filter = ['last_played']
-    search_fields = ['user__username', 'user__email']
-    readonly_fields = ['last_played']
-    ordering = ['-best_score_percentage']
+@admin.register(PlaylistCrawl)
+class PlaylistCrawlAdmin(admin.ModelAdmin):
+    list_display = ['playlist_name', 'playlist_id', 'tracks_with_preview', 'total_tracks', 'get_coverage_percentage', 'completed_at', 'updated_at']
+    list_filter = ['completed_at']
+    search_fields = ['playlist_name', 'playlist_id']
+    ordering = ['-updated_at']
+
+@admin.register(TrackPreviewStatus)
+class TrackPreviewStatusAdmin(admin.ModelAdmin):
+    list_display = ['track_name', 'artist_name', 'source', 'checked_at']
+    list_filter = ['source', 'checked_at']
+    search_fields = ['track_name', 'artist_name', 'track_id']
+    ordering = ['-checked_at']
@@ -0,0 +1,140 @@
+"""
+On-disk cache of 30-second preview MP3s
+
+Each preview is downloaded from Spotify's CDN once and kept as a file named
+after its preview ID, so every client playing the same clip is served from
+local disk. Files are evicted least-recently-used (by mtime, refreshed on
+each hit) once the directory grows past PREVIEW_AUDIO_CACHE_MAX_BYTES. IDs
+the CDN turned away are remembered for PREVIEW_AUDIO_MISSING_TTL seconds, so
+a bad ID costs one CDN request rather than one per attempt.
+"""
+
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from .preview_cache import MISS, PreviewCache
+from .spotify_client import SPOTIFY_REQUESTS_TIMEOUT, get_http_session
+
+PREVIEW_CDN_URL = "https://p.scdn.co/mp3-preview/"
+# Previews are ~100-400KB; anything much bigger isn't a preview clip
+MAX_PREVIEW_BYTES = 5 * 1024 * 1024
+PREVIEW_AUDIO_MISSING_TTL = int(os.getenv("PREVIEW_AUDIO_MISSING_TTL", "600"))
+
+_PREVIEW_ID_RE = re.compile(r"^[A-Za-z0-9]{8,64}$")
+_download_locks = {}
+_download_locks_guard = threading.Lock()
+# Preview IDs the CDN answered with a 4xx; only negative entries are stored
+_missing = PreviewCache(negative_ttl=PREVIEW_AUDIO_MISSING_TTL, max_bytes=1024 * 1024)
+
+
+class PreviewDownloadError(Exception):
+    pass
+
+
+def preview_id_from_url(preview_url: str) -> Optional[str]:
+    """Return the CDN preview ID of a p.scdn.co preview URL, or None for any other URL."""
+    parsed = urlparse(preview_url or "")
+    if parsed.netloc != "p.scdn.co" or not parsed.path.startswith("/mp3-preview/"):
+        return None
+    preview_id = parsed.path[len("/mp3-preview/"):]
+    return preview_id if is_valid_preview_id(preview_id) else None
+
+
+def is_valid_preview_id(preview_id: str) -> bool:
+    return bool(_PREVIEW_ID_RE.match(preview_id or ""))
+
+
+def _cache_dir() -> Path:
+    path = Path(settings.PREVIEW_AUDIO_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _lock_for(preview_id: str) -> threading.Lock:
+    with _download_locks_guard:
+        return _download_locks.setdefault(preview_id, threading.Lock())
+
+
+def get_preview_file(preview_id: str) -> Path:
+    """
+    Return the path of the cached MP3 for preview_id, downloading it on first use
+
+    Concurrent requests for the same uncached preview wait for one download.
+    """
+    path = _cache_dir() / f"{preview_id}.mp3"
+    if not path.exists():
+        if _missing.get(preview_id) is not MISS:
+            raise PreviewDownloadError("CDN has no such preview")
+        try:
+            with _lock_for(preview_id):
+                if not path.exists():
+                    _download(preview_id, path)
+                    _evict(keep=path)
+        finally:
+            with _download_locks_guard:
+                _download_locks.pop(preview_id, None)
+    else:
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return path
+
+
+def _download(preview_id: str, path: Path) -> None:
+    resp = get_http_session().get(PREVIEW_CDN_URL + preview_id, stream=True, timeout=SPOTIFY_REQUESTS_TIMEOUT)
+    with resp:
+        if resp.status_code != 200:
+            if 400 <= resp.status_code < 500 and resp.status_code != 429:
+                _missing.set(preview_id, None, negative=True)
+            raise PreviewDownloadError(f"CDN returned {resp.status_code}")
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        try:
+            size = 0
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in resp.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > MAX_PREVIEW_BYTES:
+                        raise PreviewDownloadError("Preview is too large")
+                    tmp.write(chunk)
+            # Readers only ever see complete files
+            os.replace(tmp_name, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
+
+
+def _evict(keep: Path) -> None:
+    """Delete least recently used previews until the cache fits its size budget."""
+    max_bytes = settings.PREVIEW_AUDIO_CACHE_MAX_BYTES
+    entries = []
+    total = 0
+    with os.scandir(keep.parent) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    if total <= max_bytes:
+        return
+    for _, size, entry_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry_path == str(keep):
+            continue
+        try:
+            os.unlink(entry_path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,87 @@
+"""
+Request authentication against Spotify
+
+Every view gets its access token through resolve_access_token /
+aresolve_access_token, which refresh an expired token before the view uses
+it. The result is memoized on the request, and concurrent refreshes of the
+same refresh token are collapsed into one call to the accounts service.
+"""
+
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+
+from .singleflight import SingleFlight
+from .spotify_client import run_blocking
+from .token_refresher import TokenRefreshScheduler
+from .token_store import get_request_token_info, token_store
+from .utils import get_spotify_oauth
+
+_refreshes = SingleFlight()
+
+
+def refresh_token_info(session_key: str, token_info: Dict) -> Dict:
+    """
+    Refresh an expired token_info and store it for the session
+
+    Only one refresh per refresh token is in flight at a time; the others
+    wait for it and reuse its result.
+    """
+    oauth = get_spotify_oauth()
+
+    def refresh():
+        # Another worker may have refreshed already; check the shared store first
+        current = token_store.get(session_key, fresh=True)
+        if current and current.get("access_token") != token_info.get("access_token") \
+                and not oauth.is_token_expired(current):
+            return current
+        return oauth.refresh_access_token(token_info["refresh_token"])
+
+    refreshed = _refreshes.do(token_info["refresh_token"], refresh)
+    token_store.set(session_key, refreshed)
+    return refreshed
+
+
+# Refreshes tokens ahead of expiry off the request path; the checks in
+# resolve_token_info only matter if it falls behind
+token_refresher = TokenRefreshScheduler(refresh_token_info)
+
+
+def _is_expired(token_info: Optional[Dict]) -> bool:
+    return bool(token_info) and get_spotify_oauth().is_token_expired(token_info)
+
+
+def resolve_token_info(request) -> Optional[Dict]:
+    """Return a valid token_info for this request (refreshed if needed), or None if not logged in."""
+    if hasattr(request, "_spotify_token_info"):
+        return request._spotify_token_info
+
+    token_info = get_request_token_info(request)
+    if _is_expired(token_info):
+        token_info = refresh_token_info(request.session.session_key, token_info)
+    token_refresher.track(request.session.session_key, token_info)
+    request._spotify_token_info = token_info
+    return token_info
+
+
+async def aresolve_token_info(request) -> Optional[Dict]:
+    """Async resolve_token_info()."""
+    if hasattr(request, "_spotify_token_info"):
+        return request._spotify_token_info
+
+    # The legacy session fallback can hit the database, so that part stays on
+    # Django's sync thread; the refresh itself runs on the shared pool
+    token_info = await sync_to_async(get_request_token_info)(request)
+    if _is_expired(token_info):
+        token_info = await run_blocking(refresh_token_info, request.session.session_key, token_info)
+    token_refresher.track(request.session.session_key, token_info)
+    request._spotify_token_info = token_info
+    return token_info
+
+
+def resolve_access_token(request) -> Optional[str]:
+    return (resolve_token_info(request) or {}).get("access_token")
+
+
+async def aresolve_access_token(request) -> Optional[str]:
+    return (await aresolve_token_info(request) or {}).get("access_token")
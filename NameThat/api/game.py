@@ -0,0 +1,229 @@
+"""
+Game engine
+
+Starting a game shuffles the playlist into an ordered queue of candidate
+tracks (no repeats) and turns them, in order, into GameRound rows whose
+preview URL is already resolved. Only the first round is resolved on the
+request path; a background prefetch keeps the next GAME_PREFETCH_ROUNDS
+rounds ready, so starting a round is a single database lookup.
+
+Queues live in process memory only while a game is being played: a game's
+queue is dropped when its last round is served or it fails, and the map is
+bounded by GAME_MAX_QUEUES and GAME_QUEUE_IDLE_SECONDS. A game whose queue
+was dropped rebuilds it from the database on its next round.
+
+A game's source is a playlist, or the user's Liked Songs when its playlist
+ID is LIBRARY_PLAYLIST_ID.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.db import close_old_connections
+
+from .library import LIBRARY_NAME, LIBRARY_PLAYLIST_ID, get_library_tracks
+from .models import GameRound, GameSession
+from .playlist_cache import get_playlist_tracks
+from .preview_service import resolve_previews, track_artist_pair
+from .tracks import Track
+
+GAME_DEFAULT_ROUNDS = int(os.getenv("GAME_DEFAULT_ROUNDS", "10"))
+GAME_MAX_ROUNDS = 50
+GAME_PREFETCH_ROUNDS = int(os.getenv("GAME_PREFETCH_ROUNDS", "3"))
+GAME_MAX_QUEUES = int(os.getenv("GAME_MAX_QUEUES", "500"))
+GAME_QUEUE_IDLE_SECONDS = int(os.getenv("GAME_QUEUE_IDLE_SECONDS", "3600"))
+
+
+class GameError(Exception):
+    """A game request that can't be served; status is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _GameQueue:
+    """Candidate tracks not yet turned into rounds, plus how many rounds exist."""
+
+    def __init__(self, candidates: List[Track], resolved: int):
+        self.candidates = deque(candidates)
+        self.resolved = resolved
+        self.lock = threading.Lock()
+        self.used_at = time.monotonic()
+
+
+def _source_tracks(sp, session_key: str, playlist_id: str,
+                   meta_fields: Optional[str] = None) -> Tuple[Dict, List[Track]]:
+    if playlist_id == LIBRARY_PLAYLIST_ID:
+        return {"name": LIBRARY_NAME}, get_library_tracks(sp, session_key)
+    return get_playlist_tracks(sp, playlist_id, meta_fields=meta_fields)
+
+
+def _shuffled_unique(tracks: List[Track], exclude=()) -> List[Track]:
+    by_id = {track.id: track for track in tracks if track.id and track.id not in exclude}
+    candidates = list(by_id.values())
+    random.shuffle(candidates)
+    return candidates
+
+
+class GameEngine:
+    """Builds games and keeps each game's upcoming rounds resolved ahead of play."""
+
+    def __init__(self, prefetch_rounds: int = GAME_PREFETCH_ROUNDS, max_queues: int = GAME_MAX_QUEUES,
+                 queue_idle_seconds: int = GAME_QUEUE_IDLE_SECONDS):
+        self.prefetch_rounds = prefetch_rounds
+        self.max_queues = max_queues
+        self.queue_idle_seconds = queue_idle_seconds
+        self._queues = OrderedDict()  # GameSession.id -> _GameQueue, least recently used first
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="game-prefetch")
+
+    def start_game(self, sp, session_key: str, playlist_id: str, rounds: int) -> GameSession:
+        """Create a game of up to `rounds` rounds, with round 1 ready to play."""
+        meta, tracks = _source_tracks(sp, session_key, playlist_id, meta_fields="name")
+        candidates = _shuffled_unique(tracks)
+        if not candidates:
+            raise GameError("No tracks found in this playlist", status=404)
+
+        game = GameSession.objects.create(
+            session_key=session_key,
+            playlist_id=playlist_id,
+            playlist_name=meta.get("name", ""),
+            total_rounds=min(rounds, len(candidates)),
+        )
+        queue = self._remember(game.id, _GameQueue(candidates, resolved=0))
+
+        try:
+            self._fill(game, queue, target=1)
+        except Exception:
+            self._drop(game.id)
+            raise
+        if not queue.resolved:
+            self._drop(game.id)
+            game.is_active = False
+            game.save(update_fields=["is_active"])
+            raise GameError("No tracks with preview available in this playlist", status=404)
+        self._schedule_prefetch(game, queue)
+        return game
+
+    def next_round(self, sp, game: GameSession) -> GameRound:
+        """Advance the game and return the round to play."""
+        if not game.is_active or game.current_round >= game.total_rounds:
+            self._drop(game.id)
+            raise GameError("Game is over", status=410)
+
+        number = game.current_round + 1
+        queue = self._queue(sp, game)
+        game_round = game.rounds.filter(round_number=number).first()
+        if game_round is None:
+            # Prefetch fell behind: resolve this round on the request path
+            self._fill(game, queue, target=number)
+            game_round = game.rounds.filter(round_number=number).first()
+            if game_round is None:
+                self._drop(game.id)
+                raise GameError("Game is over", status=410)
+
+        game.current_round = number
+        if number >= game.total_rounds:
+            # Last round: nothing left to prefetch
+            game.is_active = False
+            game.save(update_fields=["current_round", "is_active"])
+            self._drop(game.id)
+            return game_round
+        game.save(update_fields=["current_round"])
+        self._schedule_prefetch(game, queue)
+        return game_round
+
+    def _queue(self, sp, game: GameSession) -> _GameQueue:
+        with self._lock:
+            queue = self._queues.get(game.id)
+            if queue is not None:
+                queue.used_at = time.monotonic()
+                self._queues.move_to_end(game.id)
+                return queue
+
+        # Not in this process (restart or another worker): rebuild the queue from
+        # the playlist, minus tracks the game has already used
+        used = set(game.rounds.values_list("track_id", flat=True))
+        _, tracks = _source_tracks(sp, game.session_key, game.playlist_id)
+        return self._remember(game.id, _GameQueue(_shuffled_unique(tracks, exclude=used), resolved=len(used)))
+
+    def _remember(self, game_id, queue: _GameQueue) -> _GameQueue:
+        """Store a game's queue (unless one already exists), evicting idle and least recently used queues."""
+        with self._lock:
+            idle_before = time.monotonic() - self.queue_idle_seconds
+            queue = self._queues.setdefault(game_id, queue)
+            queue.used_at = time.monotonic()
+            self._queues.move_to_end(game_id)
+            while self._queues:
+                oldest_id, oldest = next(iter(self._queues.items()))
+                if len(self._queues) <= self.max_queues and oldest.used_at >= idle_before:
+                    break
+                del self._queues[oldest_id]
+            return queue
+
+    def _drop(self, game_id) -> None:
+        with self._lock:
+            self._queues.pop(game_id, None)
+
+    def _schedule_prefetch(self, game: GameSession, queue: _GameQueue) -> None:
+        target = min(game.current_round + self.prefetch_rounds, game.total_rounds)
+        if queue.resolved >= target or not queue.candidates:
+            return
+
+        def prefetch():
+            try:
+                self._fill(game, queue, target)
+            except Exception as e:
+                print(f"Round prefetch failed for game {game.id}: {e}")
+            finally:
+                close_old_connections()
+
+        self._prefetcher.submit(prefetch)
+
+    def _fill(self, game: GameSession, queue: _GameQueue, target: int) -> None:
+        """Turn queued candidates into rounds, in order, until `target` rounds exist."""
+        with queue.lock:
+            target = min(target, game.total_rounds)
+            while queue.resolved < target and queue.candidates:
+                # Take a few spare candidates so one batch usually covers the misses
+                need = target - queue.resolved
+                batch = [queue.candidates.popleft() for _ in range(min(len(queue.candidates), need * 2))]
+
+                missing = [track for track in batch if not track.preview_url]
+                resolved = {}
+                for i, preview_url in resolve_previews([track_artist_pair(track) for track in missing]):
+                    if preview_url:
+                        resolved[missing[i].id] = preview_url
+
+                for track in batch:
+                    preview_url = track.preview_url or resolved.get(track.id)
+                    if not preview_url or queue.resolved >= game.total_rounds:
+                        continue
+                    queue.resolved += 1
+                    self._create_round(game, queue.resolved, track, preview_url)
+
+            if queue.resolved < target and not queue.candidates:
+                # Fewer playable tracks than rounds asked for: shorten the game
+                game.total_rounds = queue.resolved
+                GameSession.objects.filter(pk=game.pk).update(total_rounds=queue.resolved)
+
+    def _create_round(self, game: GameSession, number: int, track: Track, preview_url: str) -> GameRound:
+        return GameRound.objects.create(
+            game_session=game,
+            round_number=number,
+            track_id=track.id,
+            track_name=track.name[:200],
+            artist_name=track.artists[:200],
+            album_name=track.album[:200],
+            album_image=track.album_image or "",
+            preview_url=preview_url,
+        )
+
+
+game_engine = GameEngine()
@@ -0,0 +1,84 @@
+"""
+Conditional-request cache for Spotify API reads
+
+Successful GETs that come back with an ETag are stored (body and headers) in
+the "spotify_http" cache, keyed by URL, plus the credentials for the current
+user's /me endpoints so users don't overwrite each other's entries. Later
+reads of the same URL send If-None-Match, and a 304 is answered from the
+stored body, so unchanged playlists and tracks cost Spotify a round trip but
+no payload.
+
+Revalidation always goes to Spotify with the caller's own token, so a stored
+body is only ever reused after Spotify has authorized that caller. When
+Spotify fails instead (5xx, 429 or no response), the stored body is served
+stale, but only to the same credentials that fetched it.
+"""
+
+import hashlib
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from django.core.cache import caches
+
+HTTP_CACHE_ALIAS = "spotify_http"
+# Response headers worth replaying on a cached response
+_KEPT_HEADERS = ("Content-Type", "ETag", "Cache-Control")
+
+
+def _auth_scope(request: requests.PreparedRequest) -> str:
+    return hashlib.sha1((request.headers.get("Authorization") or "").encode()).hexdigest()
+
+
+def _key(request: requests.PreparedRequest) -> str:
+    key = "spotify-http:" + hashlib.sha1(request.url.encode()).hexdigest()
+    path = urlparse(request.url).path
+    if path == "/v1/me" or path.startswith("/v1/me/"):
+        # The same URL means something different for every user
+        key += ":" + _auth_scope(request)
+    return key
+
+
+def lookup(request: requests.PreparedRequest) -> Optional[Dict]:
+    try:
+        return caches[HTTP_CACHE_ALIAS].get(_key(request))
+    except Exception as e:
+        print(f"Spotify HTTP cache read failed: {e}")
+        return None
+
+
+def store(request: requests.PreparedRequest, response: requests.Response) -> None:
+    """Remember a 200 response that carries an ETag."""
+    etag = response.headers.get("ETag")
+    if response.status_code != 200 or not etag:
+        return
+    entry = {
+        "etag": etag,
+        "body": response.content,
+        "headers": {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers},
+        "auth": _auth_scope(request),
+        "stored_at": time.time(),
+    }
+    try:
+        caches[HTTP_CACHE_ALIAS].set(_key(request), entry)
+    except Exception as e:
+        print(f"Spotify HTTP cache write failed: {e}")
+
+
+def can_serve_stale(entry: Optional[Dict], request: requests.PreparedRequest) -> bool:
+    return bool(entry) and entry["auth"] == _auth_scope(request)
+
+
+def cached_response(entry: Dict, request: requests.PreparedRequest, stale: bool = False) -> requests.Response:
+    """Build a 200 response from a stored entry, as if Spotify had sent it."""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.url = request.url
+    response.request = request
+    response.headers.update(entry["headers"])
+    response.headers["X-Cache"] = "STALE" if stale else "REVALIDATED"
+    response._content = entry["body"]
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers) or "utf-8"
+    return response
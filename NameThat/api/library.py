@@ -0,0 +1,99 @@
+"""
+Saved-tracks (Liked Songs) loader
+
+A user's whole library is loaded once, with pages after the first fetched
+concurrently, and cached per session as Track records together with an
+added_at watermark. Later syncs walk the newest-first collection only until
+they reach the watermark and prepend what's new. If the result doesn't add
+up to Spotify's total (tracks were removed), the library is reloaded in full.
+"""
+
+from typing import Dict, List, Optional
+
+from django.core.cache import caches
+
+from .playlist_cache import CACHE_ALIAS, TRACKS_FORMAT
+from .playlist_loader import fetch_all_pages
+from .tracks import Track
+
+# Playlist ID that stands for the user's Liked Songs wherever a playlist is expected
+LIBRARY_PLAYLIST_ID = "liked"
+LIBRARY_NAME = "Liked Songs"
+LIBRARY_PAGE_SIZE = 50  # Spotify's maximum for saved tracks
+
+
+def _cache_key(session_key: str) -> str:
+    return f"library:v{TRACKS_FORMAT}:{session_key}"
+
+
+def _entry(items: List[Dict]) -> Dict:
+    """Cache entry for newest-first saved-track items."""
+    watermark = items[0].get("added_at") if items else None
+    return {
+        "tracks": [Track.from_spotify(item["track"]) for item in items if item.get("track")],
+        # Items Spotify counts, including any without a track
+        "count": len(items),
+        "watermark": watermark,
+        # Saves made in the same second share an added_at; remember which we have
+        "watermark_ids": [(item.get("track") or {}).get("id") for item in items if item.get("added_at") == watermark],
+    }
+
+
+def _full_load(sp, first_page: Optional[Dict] = None) -> Dict:
+    def fetch_page(offset, limit):
+        return sp.current_user_saved_tracks(limit=limit, offset=offset)
+
+    first_page = first_page or fetch_page(0, LIBRARY_PAGE_SIZE)
+    return _entry(fetch_all_pages(fetch_page, page_size=LIBRARY_PAGE_SIZE, first_page=first_page))
+
+
+def _new_items(sp, entry: Dict, first_page: Dict) -> Optional[List[Dict]]:
+    """Items saved since the entry's watermark, newest first, or None if the walk ran off the end."""
+    watermark, known = entry["watermark"], set(entry["watermark_ids"])
+    new_items = []
+    page, offset = first_page, 0
+    while True:
+        for item in page.get("items") or []:
+            added_at = item.get("added_at") or ""
+            if added_at < watermark or (added_at == watermark and (item.get("track") or {}).get("id") in known):
+                return new_items
+            new_items.append(item)
+        offset += LIBRARY_PAGE_SIZE
+        if offset >= (page.get("total") or 0):
+            return None
+        page = sp.current_user_saved_tracks(limit=LIBRARY_PAGE_SIZE, offset=offset)
+
+
+def get_library_tracks(sp, session_key: str) -> List[Track]:
+    """
+    Return the user's saved tracks, newest first, syncing only what's changed
+
+    Args:
+        sp: spotipy client authenticated as the user (user-library-read scope)
+        session_key: The user's session key, which scopes the cache entry
+    """
+    cache = caches[CACHE_ALIAS]
+    entry = cache.get(_cache_key(session_key)) if session_key else None
+    first_page = sp.current_user_saved_tracks(limit=LIBRARY_PAGE_SIZE, offset=0)
+    total = first_page.get("total") or 0
+
+    if entry is None or entry["watermark"] is None:
+        entry = _full_load(sp, first_page)
+    else:
+        new_items = _new_items(sp, entry, first_page)
+        if new_items is None or len(new_items) + entry["count"] != total:
+            # Something was unsaved (or the watermark is gone): start over
+            entry = _full_load(sp, first_page)
+        elif new_items:
+            synced = _entry(new_items)
+            synced["tracks"] += entry["tracks"]
+            synced["count"] += entry["count"]
+            if synced["watermark"] == entry["watermark"]:
+                synced["watermark_ids"] += entry["watermark_ids"]
+            entry = synced
+        else:
+            return entry["tracks"]
+
+    if session_key:
+        cache.set(_cache_key(session_key), entry)
+    return entry["tracks"]
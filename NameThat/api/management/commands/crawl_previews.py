@@ -0,0 +1,201 @@
+"""
+Crawl playlists and record which of their tracks have a playable preview
+
+    python manage.py crawl_previews --session <session key>
+    python manage.py crawl_previews <playlist id> [<playlist id> ...]
+
+With a session key and no playlist IDs, every playlist in that user's library
+is crawled ("liked" crawls their Liked Songs). Without a session, the given
+playlists are read with the app's client-credentials token, so they must be
+public.
+
+Playlists are crawled concurrently; every Spotify call goes through the
+shared rate-limited session, so the worker count doesn't need tuning against
+Spotify's limits. Each track's result is saved as a TrackPreviewStatus and
+each playlist's progress as a PlaylistCrawl after every batch, so an
+interrupted crawl picks up where it left off: tracks checked within --max-age
+are not looked up again, and a completed playlist whose snapshot hasn't
+changed is skipped.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api.auth import refresh_token_info
+from api.library import LIBRARY_NAME, LIBRARY_PLAYLIST_ID, get_library_tracks
+from api.models import PlaylistCrawl, TrackPreviewStatus
+from api.playlist_cache import get_playlist_tracks
+from api.preview_cache import MISS, preview_cache, preview_key
+from api.preview_service import resolve_previews, track_artist_pair
+from api.spotify_client import get_app_spotify_client, get_spotify_client
+from api.token_store import token_store
+from api.tracks import Track
+from api.user_playlists import get_user_playlists
+from api.utils import get_spotify_oauth
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_AGE_DAYS = 7
+
+
+class Command(BaseCommand):
+    help = "Resolve preview availability for every track in a set of playlists and save a coverage report"
+
+    def add_arguments(self, parser):
+        parser.add_argument("playlist_ids", nargs="*",
+                            help=f"Playlists to crawl (default: all of the session user's; '{LIBRARY_PLAYLIST_ID}' for Liked Songs)")
+        parser.add_argument("--session", dest="session_key",
+                            help="Session key whose Spotify token is used (default: the app's token)")
+        parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                            help=f"Playlists crawled at once (default: {DEFAULT_WORKERS})")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f"Tracks resolved and saved per checkpoint (default: {DEFAULT_BATCH_SIZE})")
+        parser.add_argument("--max-age", type=int, default=DEFAULT_MAX_AGE_DAYS,
+                            help=f"Days before a track's result is checked again (default: {DEFAULT_MAX_AGE_DAYS})")
+        parser.add_argument("--force", action="store_true",
+                            help="Recheck every track, even completed playlists and recent results")
+
+    def handle(self, *args, **options):
+        self.session_key = options["session_key"]
+        self.batch_size = max(1, options["batch_size"])
+        self.force = options["force"]
+        self.checked_since = timezone.now() - timedelta(days=options["max_age"])
+
+        playlist_ids = options["playlist_ids"]
+        if not playlist_ids:
+            if not self.session_key:
+                raise CommandError("Pass playlist IDs, or --session to crawl a user's playlists")
+            playlist_ids = [p["id"] for p in get_user_playlists(self._client(), self.session_key)]
+        if LIBRARY_PLAYLIST_ID in playlist_ids and not self.session_key:
+            raise CommandError("Crawling Liked Songs needs --session")
+        self._client()  # Fail early on a missing session
+
+        playlist_ids = list(dict.fromkeys(playlist_ids))
+        self.stdout.write(f"Crawling {len(playlist_ids)} playlist(s) with {options['workers']} worker(s)")
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            futures = {pool.submit(self._crawl_playlist, playlist_id): playlist_id for playlist_id in playlist_ids}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.stderr.write(f"Crawl failed for playlist {futures[future]}: {e}")
+
+        self._report(playlist_ids)
+
+    def _client(self):
+        """A Spotify client for this crawl, refreshing the session's token when it has expired."""
+        if not self.session_key:
+            return get_app_spotify_client()
+        token_info = token_store.get(self.session_key)
+        if not token_info:
+            raise CommandError(f"No Spotify token stored for session {self.session_key}")
+        if get_spotify_oauth().is_token_expired(token_info):
+            token_info = refresh_token_info(self.session_key, token_info)
+        return get_spotify_client(token_info["access_token"])
+
+    def _load(self, playlist_id: str) -> Tuple[Dict, List[Track]]:
+        sp = self._client()
+        if playlist_id == LIBRARY_PLAYLIST_ID:
+            return {"name": LIBRARY_NAME}, get_library_tracks(sp, self.session_key)
+        return get_playlist_tracks(sp, playlist_id, meta_fields="name")
+
+    def _crawl_playlist(self, playlist_id: str) -> None:
+        # Each worker thread has its own DB connection
+        close_old_connections()
+        try:
+            meta, tracks = self._load(playlist_id)
+            snapshot_id = meta.get("snapshot_id") or ""
+            crawl, _ = PlaylistCrawl.objects.get_or_create(playlist_id=playlist_id)
+            if not self.force and crawl.completed_at and snapshot_id and crawl.snapshot_id == snapshot_id:
+                self.stdout.write(f"{crawl}: unchanged since last crawl, skipped")
+                return
+
+            unique = list({track.id: track for track in tracks if track.id}.values())
+            crawl.playlist_name = meta.get("name") or ""
+            crawl.snapshot_id = snapshot_id
+            crawl.total_tracks = len(unique)
+            crawl.tracks_checked = crawl.tracks_with_preview = 0
+            crawl.completed_at = None
+
+            unresolved = 0
+            for start in range(0, len(unique), self.batch_size):
+                statuses = self._check_batch(unique[start:start + self.batch_size])
+                unresolved += min(self.batch_size, len(unique) - start) - len(statuses)
+                crawl.tracks_checked += len(statuses)
+                crawl.tracks_with_preview += sum(1 for status in statuses if status.has_preview)
+                crawl.save()  # Checkpoint
+
+            if not unresolved:
+                crawl.completed_at = timezone.now()
+                crawl.save()
+            self.stdout.write(f"{crawl}: {crawl.get_coverage_percentage()}% have previews"
+                              + (f", {unresolved} lookup(s) failed" if unresolved else ""))
+        finally:
+            close_old_connections()
+
+    def _check_batch(self, tracks: List[Track]) -> List[TrackPreviewStatus]:
+        """
+        Return preview statuses for a batch of tracks, looking up and saving those not checked recently
+
+        Tracks whose lookup failed (rather than finding no preview) get no
+        status, so they're retried on the next crawl.
+        """
+        known = {}
+        if not self.force:
+            recent = TrackPreviewStatus.objects.filter(
+                track_id__in=[track.id for track in tracks], checked_at__gte=self.checked_since)
+            known = {status.track_id: status for status in recent}
+
+        checked = []
+        missing = []
+        for track in tracks:
+            if track.id in known:
+                continue
+            if track.preview_url:
+                checked.append(self._status(track, track.preview_url, TrackPreviewStatus.SOURCE_SPOTIFY))
+            else:
+                missing.append(track)
+
+        pairs = [track_artist_pair(track) for track in missing]
+        for i, preview in resolve_previews(pairs):
+            if preview:
+                checked.append(self._status(missing[i], preview, TrackPreviewStatus.SOURCE_SERVICE))
+            elif preview_cache.get(preview_key(*pairs[i])) is not MISS:
+                # The service answered "no preview", as opposed to failing
+                checked.append(self._status(missing[i], "", TrackPreviewStatus.SOURCE_NONE))
+
+        TrackPreviewStatus.objects.bulk_create(
+            checked, update_conflicts=True, unique_fields=["track_id"],
+            update_fields=["track_name", "artist_name", "preview_url", "source", "checked_at"],
+        )
+        return list(known.values()) + checked
+
+    @staticmethod
+    def _status(track: Track, preview_url: str, source: str) -> TrackPreviewStatus:
+        return TrackPreviewStatus(
+            track_id=track.id,
+            track_name=track.name[:200],
+            artist_name=track.first_artist[:200],
+            preview_url=preview_url,
+            source=source,
+        )
+
+    def _report(self, playlist_ids: List[str]) -> None:
+        crawls = PlaylistCrawl.objects.filter(playlist_id__in=playlist_ids).order_by("playlist_name")
+        total = with_preview = 0
+        self.stdout.write("\nPreview coverage:")
+        for crawl in crawls:
+            state = "complete" if crawl.completed_at else f"{crawl.tracks_checked}/{crawl.total_tracks} checked"
+            self.stdout.write(f"  {crawl.get_coverage_percentage():5.1f}%  "
+                              f"{crawl.tracks_with_preview:>5}/{crawl.total_tracks:<5}  "
+                              f"{crawl.playlist_name or crawl.playlist_id}  ({state})")
+            total += crawl.total_tracks
+            with_preview += crawl.tracks_with_preview
+        if total:
+            self.stdout.write(self.style.SUCCESS(
+                f"\n{with_preview}/{total} tracks ({round(100.0 * with_preview / total, 1)}%) have previews"))
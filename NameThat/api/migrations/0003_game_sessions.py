@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:00
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_remove_gamesession_user_remove_userstats_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('session_key', models.CharField(db_index=True, max_length=40)),
+                ('playlist_id', models.CharField(max_length=100)),
+                ('playlist_name', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('total_rounds', models.IntegerField(default=0)),
+                ('current_round', models.IntegerField(default=0)),
+                ('correct_guesses', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GameRound',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('round_number', models.IntegerField()),
+                ('track_id', models.CharField(max_length=100)),
+                ('track_name', models.CharField(max_length=200)),
+                ('artist_name', models.CharField(blank=True, max_length=200)),
+                ('album_name', models.CharField(blank=True, max_length=200)),
+                ('album_image', models.URLField(blank=True, max_length=500)),
+                ('preview_url', models.URLField(max_length=500)),
+                ('user_guess', models.CharField(blank=True, max_length=200)),
+                ('is_correct', models.BooleanField(null=True)),
+                ('time_taken', models.FloatField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('game_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rounds', to='api.gamesession')),
+            ],
+            options={
+                'ordering': ['round_number'],
+                'constraints': [models.UniqueConstraint(fields=('game_session', 'round_number'), name='unique_round_number')],
+            },
+        ),
+    ]
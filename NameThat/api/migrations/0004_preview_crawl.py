@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_game_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaylistCrawl',
+            fields=[
+                ('playlist_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('playlist_name', models.CharField(blank=True, max_length=200)),
+                ('snapshot_id', models.CharField(blank=True, max_length=100)),
+                ('total_tracks', models.IntegerField(default=0)),
+                ('tracks_checked', models.IntegerField(default=0)),
+                ('tracks_with_preview', models.IntegerField(default=0)),
+                ('completed_at', models.DateTimeField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrackPreviewStatus',
+            fields=[
+                ('track_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('track_name', models.CharField(max_length=200)),
+                ('artist_name', models.CharField(blank=True, max_length=200)),
+                ('preview_url', models.URLField(blank=True, max_length=500)),
+                ('source', models.CharField(choices=[('spotify', 'Spotify'), ('service', 'Preview service'), ('none', 'No preview')], max_length=10)),
+                ('checked_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
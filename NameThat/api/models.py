@@ -2,3 +2,97 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 
+
+class GameSession(models.Model):
+    """A game over one playlist, owned by the browser session that started it."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session_key = models.CharField(max_length=40, db_index=True)
+    playlist_id = models.CharField(max_length=100)
+    playlist_name = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+    is_active = models.BooleanField(default=True)
+    total_rounds = models.IntegerField(default=0)
+    current_round = models.IntegerField(default=0)
+    correct_guesses = models.IntegerField(default=0)
+
+    def get_score_percentage(self):
+        if not self.current_round:
+            return 0.0
+        return round(100.0 * self.correct_guesses / self.current_round, 1)
+    get_score_percentage.short_description = "Score %"
+
+    def __str__(self):
+        return f"{self.playlist_name} ({self.current_round}/{self.total_rounds})"
+
+
+class GameRound(models.Model):
+    """A pre-generated round: the track to guess, with its preview already resolved."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    game_session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name="rounds")
+    round_number = models.IntegerField()
+    track_id = models.CharField(max_length=100)
+    track_name = models.CharField(max_length=200)
+    artist_name = models.CharField(max_length=200, blank=True)
+    album_name = models.CharField(max_length=200, blank=True)
+    album_image = models.URLField(max_length=500, blank=True)
+    preview_url = models.URLField(max_length=500)
+    user_guess = models.CharField(max_length=200, blank=True)
+    is_correct = models.BooleanField(null=True)
+    time_taken = models.FloatField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["round_number"]
+        constraints = [
+            models.UniqueConstraint(fields=["game_session", "round_number"], name="unique_round_number"),
+        ]
+
+    def __str__(self):
+        return f"Round {self.round_number}: {self.track_name}"
+
+
+class TrackPreviewStatus(models.Model):
+    """Whether a track has a playable preview, as last found by the crawl_previews command."""
+    SOURCE_SPOTIFY = "spotify"
+    SOURCE_SERVICE = "service"
+    SOURCE_NONE = "none"
+    SOURCE_CHOICES = [
+        (SOURCE_SPOTIFY, "Spotify"),
+        (SOURCE_SERVICE, "Preview service"),
+        (SOURCE_NONE, "No preview"),
+    ]
+
+    track_id = models.CharField(max_length=100, primary_key=True)
+    track_name = models.CharField(max_length=200)
+    artist_name = models.CharField(max_length=200, blank=True)
+    preview_url = models.URLField(max_length=500, blank=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    checked_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def has_preview(self):
+        return bool(self.preview_url)
+
+    def __str__(self):
+        return f"{self.track_name} ({self.source})"
+
+
+class PlaylistCrawl(models.Model):
+    """crawl_previews checkpoint and coverage for one playlist."""
+    playlist_id = models.CharField(max_length=100, primary_key=True)
+    playlist_name = models.CharField(max_length=200, blank=True)
+    snapshot_id = models.CharField(max_length=100, blank=True)
+    total_tracks = models.IntegerField(default=0)
+    tracks_checked = models.IntegerField(default=0)
+    tracks_with_preview = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_coverage_percentage(self):
+        if not self.total_tracks:
+            return 0.0
+        return round(100.0 * self.tracks_with_preview / self.total_tracks, 1)
+    get_coverage_percentage.short_description = "Coverage %"
+
+    def __str__(self):
+        return f"{self.playlist_name or self.playlist_id} ({self.tracks_with_preview}/{self.total_tracks})"
@@ -0,0 +1,145 @@
+"""
+Playable-track index
+
+Keeps, per playlist, the list of tracks already known to have a preview URL
+so a random round is a constant-time random.choice(). Tracks Spotify doesn't
+give a preview for are resolved with one batched preview-service call and
+appended as they succeed.
+
+Indexes are shared by every user, so each read first checks the playlist's
+snapshot_id with the caller's own token (served from the catalog scope for
+public playlists): a user who can't read the playlist never gets its index,
+and an index behind the current snapshot is rebuilt off the request path.
+"""
+
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .playlist_cache import get_playlist_tracks, playlist_snapshot_id
+from .preview_service import resolve_previews, track_artist_pair
+from .tracks import Track
+
+MAX_PLAYLISTS = int(os.getenv("PLAYABLE_INDEX_MAX_PLAYLISTS", "200"))
+RESOLVE_WORKERS = int(os.getenv("PLAYABLE_INDEX_RESOLVE_WORKERS", "4"))
+
+
+class PlaylistIndex:
+    """Playable tracks of one playlist snapshot, each with its preview_url filled in."""
+
+    def __init__(self, snapshot_id: Optional[str], track_count: int, playable: List[Track]):
+        self.snapshot_id = snapshot_id
+        self.track_count = track_count
+        # Only ever appended to, so readers can pick from it while resolution runs
+        self.playable = playable
+        self.refreshing = False
+
+    def random_track(self) -> Optional[Track]:
+        """Return a random playable track, or None if nothing is playable."""
+        if not self.playable:
+            return None
+        return random.choice(self.playable)
+
+
+class PlayableTrackIndex:
+    """Process-wide, LRU-bounded map of playlist ID to PlaylistIndex."""
+
+    def __init__(self, max_playlists: int = MAX_PLAYLISTS, resolve_workers: int = RESOLVE_WORKERS):
+        self.max_playlists = max_playlists
+        self._lock = threading.Lock()
+        self._playlists = OrderedDict()
+        self._resolver = ThreadPoolExecutor(max_workers=resolve_workers, thread_name_prefix="preview-resolve")
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="playable-index")
+
+    def get(self, sp, playlist_id: str) -> PlaylistIndex:
+        """
+        Return the playlist's index, building it on first use
+
+        An existing index is only returned once sp has read the playlist's
+        snapshot_id, so Spotify's access check applies to every caller; it
+        raises for users who can't read the playlist. An index behind the
+        current snapshot is returned as-is and rebuilt in the background.
+        """
+        with self._lock:
+            entry = self._playlists.get(playlist_id)
+        if entry is None:
+            # Building reads the playlist with sp, which is the access check
+            return self._build(sp, playlist_id, previous=None, wait_for_first=True)
+
+        snapshot_id = playlist_snapshot_id(sp, playlist_id)
+        with self._lock:
+            if playlist_id in self._playlists:
+                self._playlists.move_to_end(playlist_id)
+        if snapshot_id != entry.snapshot_id:
+            self._schedule_refresh(sp, playlist_id, entry)
+        return entry
+
+    def _schedule_refresh(self, sp, playlist_id: str, entry: PlaylistIndex) -> None:
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh():
+            try:
+                self._build(sp, playlist_id, previous=entry, wait_for_first=False)
+            except Exception as e:
+                print(f"Playable index refresh failed for {playlist_id}: {e}")
+            finally:
+                entry.refreshing = False
+
+        self._refresher.submit(refresh)
+
+    def _store(self, playlist_id: str, entry: PlaylistIndex) -> None:
+        with self._lock:
+            self._playlists[playlist_id] = entry
+            self._playlists.move_to_end(playlist_id)
+            while len(self._playlists) > self.max_playlists:
+                self._playlists.popitem(last=False)
+
+    def _build(self, sp, playlist_id: str, previous: Optional[PlaylistIndex], wait_for_first: bool) -> PlaylistIndex:
+        meta, tracks = get_playlist_tracks(sp, playlist_id)
+        snapshot_id = meta.get("snapshot_id")
+
+        if previous is not None and snapshot_id and previous.snapshot_id == snapshot_id:
+            return previous
+
+        # Reuse previews already resolved for tracks that survived the edit
+        known = {track.id: track.preview_url for track in previous.playable} if previous else {}
+        playable = []
+        missing = []
+        for track in tracks:
+            preview_url = track.preview_url or known.get(track.id)
+            if preview_url:
+                playable.append(track.with_preview(preview_url))
+            else:
+                missing.append(track)
+
+        entry = PlaylistIndex(snapshot_id, len(tracks), playable)
+        self._store(playlist_id, entry)
+        if not missing:
+            return entry
+
+        # One batched preview-service call; results stream back as they resolve
+        results = resolve_previews([track_artist_pair(track) for track in missing])
+
+        def consume():
+            for i, preview_url in results:
+                if preview_url:
+                    entry.playable.append(missing[i].with_preview(preview_url))
+
+        if wait_for_first and not playable:
+            # Nothing to serve yet: wait only until the first resolution succeeds,
+            # the rest keep filling the index in the background
+            for i, preview_url in results:
+                if preview_url:
+                    entry.playable.append(missing[i].with_preview(preview_url))
+                    break
+        self._resolver.submit(consume)
+        return entry
+
+
+playable_index = PlayableTrackIndex()
@@ -0,0 +1,272 @@
+"""
+Playlist snapshot cache
+
+Stores each playlist's track list alongside the snapshot_id it was fetched
+at. Every read revalidates with a cheap fields=snapshot_id call and only
+reloads the full track list when Spotify reports a new snapshot.
+
+Callers that only need some track fields pass a track_fields filter: it's
+sent to Spotify as-is, and the projected track list is cached separately
+from the full one (which, when current, serves projected reads as well).
+
+Public playlists (editorial ones included) are also kept in a catalog scope
+shared by every user: once a user's read shows a playlist is public, it is
+loaded into the catalog with the app's client-credentials token in the
+background (the user's response never waits on it), revalidated at most
+every CATALOG_REVALIDATE_SECONDS, and later reads by any user skip Spotify
+entirely. Private playlists are always revalidated with the user's own token.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.core.cache import caches
+
+from .playlist_loader import TRACK_FIELDS, iter_playlist_items, load_playlist_items
+from .spotify_client import get_app_spotify_client, run_blocking
+from .tracks import Track
+
+CACHE_ALIAS = "playlists"
+CATALOG_REVALIDATE_SECONDS = int(os.getenv("CATALOG_REVALIDATE_SECONDS", "60"))
+# Everything any caller asks for as meta_fields, so catalog metadata serves them all
+CATALOG_META_FIELDS = "snapshot_id,public,name,description,images,owner(id,display_name)"
+# Streamed playlists longer than this aren't kept for the cache, so a stream's memory stays flat
+STREAM_CACHE_MAX_TRACKS = int(os.getenv("STREAM_CACHE_MAX_TRACKS", "10000"))
+# Bumped whenever the stored track format changes
+TRACKS_FORMAT = 2
+
+# Catalog seeding runs here, off the request path; one fill per playlist at a time
+_catalog_filler = ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog-fill")
+_filling = set()
+_filling_lock = threading.Lock()
+
+
+def _cache_key(playlist_id: str, track_fields: str = TRACK_FIELDS) -> str:
+    key = f"playlist:v{TRACKS_FORMAT}:{playlist_id}"
+    if track_fields != TRACK_FIELDS:
+        key += ":" + hashlib.sha1(track_fields.encode()).hexdigest()[:12]
+    return key
+
+
+def _catalog_key(playlist_id: str) -> str:
+    return f"catalog:v{TRACKS_FORMAT}:{playlist_id}"
+
+
+def _snapshot_fields(meta_fields: Optional[str]) -> str:
+    return f"snapshot_id,public,{meta_fields}" if meta_fields else "snapshot_id,public"
+
+
+def _to_tracks(items: List[Dict]) -> List[Track]:
+    return [Track.from_spotify(item["track"]) for item in items if item.get("track")]
+
+
+def _load_tracks(sp, playlist_id: str, track_fields: str = TRACK_FIELDS) -> List[Track]:
+    return _to_tracks(load_playlist_items(sp, playlist_id, item_fields=track_fields))
+
+
+def _store(playlist_id: str, snapshot_id: Optional[str], tracks: List[Track],
+           track_fields: str = TRACK_FIELDS) -> None:
+    # The snapshot is read before (or alongside) the tracks, so a playlist edited
+    # mid-load is stored under the older snapshot_id and reloaded on the next read.
+    if snapshot_id:
+        caches[CACHE_ALIAS].set(_cache_key(playlist_id, track_fields), {"snapshot_id": snapshot_id, "tracks": tracks})
+
+
+def _cached_entries(playlist_id: str, track_fields: str = TRACK_FIELDS) -> List[Dict]:
+    """Cached track lists that can serve track_fields: the full one, then the projected one."""
+    cache = caches[CACHE_ALIAS]
+    keys = [_cache_key(playlist_id)]
+    if track_fields != TRACK_FIELDS:
+        keys.append(_cache_key(playlist_id, track_fields))
+    return [entry for entry in (cache.get(key) for key in keys) if entry is not None]
+
+
+def _seed_catalog(playlist_id: str, meta: Dict, tracks: List[Track], track_fields: str) -> None:
+    """Queue a public playlist for the catalog scope, if it isn't in it (or ruled out) already."""
+    if not _should_fill_catalog(playlist_id, meta):
+        return
+    with _filling_lock:
+        if playlist_id in _filling:
+            return
+        _filling.add(playlist_id)
+    # A projected track list can't be reused: the catalog always holds full tracks
+    tracks = tracks if track_fields == TRACK_FIELDS else None
+
+    def seed():
+        try:
+            _fill_catalog(playlist_id, meta.get("snapshot_id"), tracks)
+        finally:
+            with _filling_lock:
+                _filling.discard(playlist_id)
+
+    _catalog_filler.submit(seed)
+
+
+def _cached_tracks(entries: List[Dict], snapshot_id: Optional[str]) -> Optional[List[Track]]:
+    for entry in entries:
+        if snapshot_id and entry["snapshot_id"] == snapshot_id:
+            return entry["tracks"]
+    return None
+
+
+def _catalog_tracks(playlist_id: str) -> Optional[Tuple[Dict, List[Track]]]:
+    """Return (meta, tracks) from the catalog scope, revalidating if due, or None if not in it."""
+    entry = caches[CACHE_ALIAS].get(_catalog_key(playlist_id))
+    if entry is None or entry["meta"] is None:
+        return None
+    if time.time() - entry["checked_at"] < CATALOG_REVALIDATE_SECONDS:
+        return entry["meta"], entry["tracks"]
+    return _fill_catalog(playlist_id, entry["meta"].get("snapshot_id"), entry["tracks"])
+
+
+def _fill_catalog(playlist_id: str, snapshot_id: Optional[str] = None,
+                  tracks: Optional[List[Track]] = None) -> Optional[Tuple[Dict, List[Track]]]:
+    """
+    (Re)load a public playlist into the catalog scope with the app token
+
+    tracks, if given, are known to be current as of snapshot_id and are reused
+    when the snapshot hasn't moved. Returns None when the playlist is no longer
+    public or can't be read with the app token; it is then left to per-user
+    reads until CATALOG_REVALIDATE_SECONDS have passed.
+    """
+    cache = caches[CACHE_ALIAS]
+    try:
+        app = get_app_spotify_client()
+        meta = app.playlist(playlist_id, fields=CATALOG_META_FIELDS)
+        if not meta.get("public"):
+            meta = None
+        elif tracks is None or meta.get("snapshot_id") != snapshot_id:
+            tracks = _load_tracks(app, playlist_id)
+    except Exception as e:
+        print(f"Catalog refresh failed for playlist {playlist_id}: {e}")
+        meta = None
+
+    if meta is None:
+        cache.set(_catalog_key(playlist_id), {"meta": None, "tracks": None, "checked_at": time.time()},
+                  timeout=CATALOG_REVALIDATE_SECONDS)
+        return None
+
+    cache.set(_catalog_key(playlist_id), {"meta": meta, "tracks": tracks, "checked_at": time.time()})
+    return meta, tracks
+
+
+def _should_fill_catalog(playlist_id: str, meta: Dict) -> bool:
+    """Whether a user's read of a public playlist should seed the catalog (not already ruled out)."""
+    if not meta.get("public"):
+        return False
+    entry = caches[CACHE_ALIAS].get(_catalog_key(playlist_id))
+    return entry is None or entry["meta"] is not None
+
+
+def get_playlist_tracks(sp, playlist_id: str, meta_fields: Optional[str] = None,
+                        track_fields: str = TRACK_FIELDS) -> Tuple[Dict, List[Track]]:
+    """
+    Return playlist metadata and its (non-null) tracks, served from cache when unchanged
+
+    Public playlists already in the catalog scope are served without calling
+    Spotify with the user's token at all.
+
+    Args:
+        sp: Authenticated spotipy client
+        playlist_id: Spotify playlist ID
+        meta_fields: Extra playlist fields to fetch with the snapshot_id check,
+            so callers that need metadata don't make a second request
+        track_fields: Spotify fields filter for each playlist item, for callers
+            that only need some track fields (tracks.spotify_fields())
+
+    Returns:
+        (playlist metadata dict, list of Track records)
+    """
+    catalog = _catalog_tracks(playlist_id)
+    if catalog is not None:
+        return catalog
+
+    meta = sp.playlist(playlist_id, fields=_snapshot_fields(meta_fields))
+    snapshot_id = meta.get("snapshot_id")
+
+    tracks = _cached_tracks(_cached_entries(playlist_id, track_fields), snapshot_id)
+    if tracks is None:
+        tracks = _load_tracks(sp, playlist_id, track_fields)
+        _store(playlist_id, snapshot_id, tracks, track_fields)
+
+    _seed_catalog(playlist_id, meta, tracks, track_fields)
+    return meta, tracks
+
+
+async def aget_playlist_tracks(sp, playlist_id: str, meta_fields: Optional[str] = None,
+                               track_fields: str = TRACK_FIELDS) -> Tuple[Dict, List[Track]]:
+    """
+    Async get_playlist_tracks()
+
+    When nothing is cached there's nothing to revalidate, so the metadata call
+    and the track pages are fetched concurrently instead of one after the other.
+    """
+    catalog = await run_blocking(_catalog_tracks, playlist_id)
+    if catalog is not None:
+        return catalog
+
+    entries = await run_blocking(_cached_entries, playlist_id, track_fields)
+    fetch_meta = run_blocking(sp.playlist, playlist_id, fields=_snapshot_fields(meta_fields))
+
+    if not entries:
+        meta, tracks = await asyncio.gather(fetch_meta, run_blocking(_load_tracks, sp, playlist_id, track_fields))
+        await run_blocking(_store, playlist_id, meta.get("snapshot_id"), tracks, track_fields)
+    else:
+        meta = await fetch_meta
+        tracks = _cached_tracks(entries, meta.get("snapshot_id"))
+        if tracks is None:
+            tracks = await run_blocking(_load_tracks, sp, playlist_id, track_fields)
+            await run_blocking(_store, playlist_id, meta.get("snapshot_id"), tracks, track_fields)
+
+    await run_blocking(_seed_catalog, playlist_id, meta, tracks, track_fields)
+    return meta, tracks
+
+
+def stream_playlist_tracks(sp, playlist_id: str, meta_fields: Optional[str] = None,
+                           track_fields: str = TRACK_FIELDS) -> Tuple[Dict, Iterator[List[Track]]]:
+    """
+    Like get_playlist_tracks(), but the tracks come as an iterator of chunks
+
+    On a cache miss each chunk is a page, yielded as soon as Spotify returns
+    it, so callers can start sending tracks before the playlist has finished
+    loading. The playlist is cached once the last page has been consumed,
+    unless it has more than STREAM_CACHE_MAX_TRACKS tracks.
+    """
+    catalog = _catalog_tracks(playlist_id)
+    if catalog is not None:
+        return catalog[0], iter([catalog[1]])
+
+    meta = sp.playlist(playlist_id, fields=_snapshot_fields(meta_fields))
+    tracks = _cached_tracks(_cached_entries(playlist_id, track_fields), meta.get("snapshot_id"))
+    if tracks is not None:
+        _seed_catalog(playlist_id, meta, tracks, track_fields)
+        return meta, iter([tracks])
+    return meta, _stream_and_store(sp, playlist_id, meta, track_fields)
+
+
+def _stream_and_store(sp, playlist_id: str, meta: Dict, track_fields: str) -> Iterator[List[Track]]:
+    tracks = []
+    for items in iter_playlist_items(sp, playlist_id, item_fields=track_fields):
+        page = _to_tracks(items)
+        if tracks is not None:
+            tracks.extend(page)
+            if len(tracks) > STREAM_CACHE_MAX_TRACKS:
+                tracks = None
+        yield page
+    if tracks is None:
+        return
+    _store(playlist_id, meta.get("snapshot_id"), tracks, track_fields)
+    _seed_catalog(playlist_id, meta, tracks, track_fields)
+
+
+def playlist_snapshot_id(sp, playlist_id: str) -> Optional[str]:
+    """The playlist's current snapshot_id, from the catalog scope if it's there, else one fields=snapshot_id call."""
+    catalog = _catalog_tracks(playlist_id)
+    if catalog is not None:
+        return catalog[0].get("snapshot_id")
+    return sp.playlist(playlist_id, fields="snapshot_id").get("snapshot_id")
@@ -0,0 +1,101 @@
+"""
+Paginated playlist loading
+
+Spotify caps playlist_tracks at 100 items per call. The first page tells us
+the playlist's total, after which the remaining offsets are fetched
+concurrently and stitched back together in playlist order. At most
+max_workers pages are requested ahead of the consumer, so a slow reader of
+iter_all_pages() doesn't make every page pile up in memory.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .tracks import spotify_fields
+
+PAGE_SIZE = 100
+MAX_PAGE_WORKERS = int(os.getenv("SPOTIFY_PAGE_WORKERS", "8"))
+
+# Everything tracks.Track keeps (its spotify_url is derived from the ID)
+TRACK_FIELDS = f"track({spotify_fields()})"
+
+
+def fetch_all_pages(fetch_page: Callable[[int, int], Dict], page_size: int = PAGE_SIZE,
+                    max_workers: int = MAX_PAGE_WORKERS, first_page: Optional[Dict] = None) -> List[Dict]:
+    """
+    Fetch every page of a Spotify paging object
+
+    Args:
+        fetch_page: Callable taking (offset, limit) and returning a page dict
+            with "items" and "total"
+        page_size: Number of items requested per page
+        max_workers: Upper bound on concurrent page requests
+        first_page: The page at offset 0, if the caller already has it
+
+    Returns:
+        All items across all pages, in order
+    """
+    items = []
+    for page_items in iter_all_pages(fetch_page, page_size, max_workers, first_page):
+        items.extend(page_items)
+    return items
+
+
+def iter_all_pages(fetch_page: Callable[[int, int], Dict], page_size: int = PAGE_SIZE,
+                   max_workers: int = MAX_PAGE_WORKERS, first_page: Optional[Dict] = None) -> Iterator[List[Dict]]:
+    """Like fetch_all_pages(), but yield each page's items, in order, as soon as it's available."""
+    if first_page is None:
+        first_page = fetch_page(0, page_size)
+    first_items = first_page.get("items") or []
+    total = first_page.get("total") or len(first_items)
+    yield first_items
+
+    offsets = range(page_size, total, page_size)
+    if not offsets:
+        return
+
+    window = max(1, min(max_workers, len(offsets)))
+    pool = ThreadPoolExecutor(max_workers=window)
+    remaining = iter(offsets)
+    pending = deque()
+
+    def submit_next():
+        offset = next(remaining, None)
+        if offset is not None:
+            pending.append(pool.submit(fetch_page, offset, page_size))
+
+    try:
+        for _ in range(window):
+            submit_next()
+        # Futures are consumed in submission order, so pages come back sorted;
+        # each one consumed makes room for the next request
+        while pending:
+            page = pending.popleft().result()
+            submit_next()
+            yield page.get("items") or []
+    finally:
+        # A consumer that stops early (e.g. a dropped stream) doesn't wait for the rest
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _playlist_page_fetcher(sp, playlist_id: str, item_fields: Optional[str]) -> Callable[[int, int], Dict]:
+    fields = f"total,items({item_fields})" if item_fields else None
+
+    def fetch_page(offset, limit):
+        return sp.playlist_tracks(playlist_id, fields=fields, limit=limit, offset=offset)
+
+    return fetch_page
+
+
+def load_playlist_items(sp, playlist_id: str, item_fields: Optional[str] = TRACK_FIELDS,
+                        max_workers: int = MAX_PAGE_WORKERS) -> List[Dict]:
+    """Return every item of a playlist, fetching pages after the first concurrently."""
+    return fetch_all_pages(_playlist_page_fetcher(sp, playlist_id, item_fields), max_workers=max_workers)
+
+
+def iter_playlist_items(sp, playlist_id: str, item_fields: Optional[str] = TRACK_FIELDS,
+                        max_workers: int = MAX_PAGE_WORKERS) -> Iterator[List[Dict]]:
+    """Yield a playlist's items page by page, in order, as the pages arrive."""
+    return iter_all_pages(_playlist_page_fetcher(sp, playlist_id, item_fields), max_workers=max_workers)
@@ -0,0 +1,90 @@
+"""
+Preview URL resolution cache
+
+A process-wide, thread-safe LRU cache shared by the preview service client
+and SpotifyPreviewFinder. Found previews live for PREVIEW_CACHE_TTL seconds;
+"no preview exists" answers are cached too, for the shorter
+PREVIEW_CACHE_NEGATIVE_TTL, so repeated misses don't pay for another lookup.
+Least recently used entries are evicted once the approximate size of the
+cache passes PREVIEW_CACHE_MAX_BYTES.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+PREVIEW_CACHE_TTL = int(os.getenv("PREVIEW_CACHE_TTL", str(24 * 60 * 60)))
+PREVIEW_CACHE_NEGATIVE_TTL = int(os.getenv("PREVIEW_CACHE_NEGATIVE_TTL", str(60 * 60)))
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Returned by PreviewCache.get() when there is no live entry, since None is a
+# valid cached value (a negative entry)
+MISS = object()
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate memory footprint of a cached value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_sizeof(v) for v in value)
+    return size
+
+
+def normalize(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of a track or artist name."""
+    return re.sub(r"\s+", " ", (text or "").strip()).casefold()
+
+
+def preview_key(track_name: str, artist_name: Optional[str]) -> str:
+    """Cache key for a preview lookup, which is always by (normalized) track and artist name."""
+    return f"q:{normalize(track_name)}|{normalize(artist_name)}"
+
+
+class PreviewCache:
+    """TTL + LRU cache with separate lifetimes for positive and negative entries."""
+
+    def __init__(self, ttl: int = PREVIEW_CACHE_TTL, negative_ttl: int = PREVIEW_CACHE_NEGATIVE_TTL,
+                 max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for key, or MISS if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, negative: bool = False) -> None:
+        """Store value under key; negative entries expire after negative_ttl."""
+        ttl = self.negative_ttl if negative else self.ttl
+        size = _sizeof(key) + _sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+
+preview_cache = PreviewCache()
@@ -1,30 +1,103 @@
 """
 Spotify Preview Finder - Python Implementation
 Based on the spotify-preview-finder npm package approach
+
+Part of the api package, so try it from `python manage.py shell`:
+
+    >>> from api.preview_finder import find_preview_urls_for_track
+    >>> find_preview_urls_for_track("Shape of You", "Ed Sheeran", 2)
 """
 
-import spotipy
+import copy
 import os
-from typing import List, Dict, Optional, Tuple
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Dict, Optional, Tuple
 import re
 
+from spotipy.exceptions import SpotifyException
+
+from .preview_cache import MISS, normalize, preview_cache
+from .spotify_client import get_app_spotify_client
+
+MARKETS = ['US', 'GB', 'CA', 'AU', 'DE', 'FR', 'JP']
+PREVIEW_FINDER_DEADLINE = float(os.getenv("PREVIEW_FINDER_DEADLINE", "5"))
+PREVIEW_FINDER_RACE = os.getenv("PREVIEW_FINDER_RACE", "").lower() in ("1", "true", "yes")
+
+# Separate pools so a strategy waiting on its market probes can never starve them
+_probe_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="preview-probe")
+_strategy_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="preview-strategy")
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Whether a failed call says nothing about the track (rate limit, server or network error, timeout)."""
+    if isinstance(error, SpotifyException):
+        return error.http_status == 429 or (error.http_status or 500) >= 500
+    return True
+
+
+def _first_hit(pool: ThreadPoolExecutor, calls: List[Callable[[], Optional[Dict]]], deadline: float,
+               failures: Optional[List] = None) -> Optional[Dict]:
+    """
+    Run calls concurrently and return the first truthy result
+    
+    Calls still queued once a result is found (or the deadline passes) are
+    cancelled; ones already running finish in the background and are ignored.
+    Without a result, transient errors and a missed deadline are appended to
+    failures.
+    """
+    pending = {pool.submit(call) for call in calls}
+    stop_at = time.monotonic() + deadline
+    try:
+        while pending:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                if failures is not None:
+                    failures.append(TimeoutError(f"No result within {deadline}s"))
+                return None
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None and future.result():
+                    return future.result()
+                if error is not None and failures is not None and _is_transient(error):
+                    failures.append(error)
+        return None
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _record_failure(track_info: Dict, error: BaseException) -> None:
+    if _is_transient(error):
+        track_info["_failures"].append(error)
+
+
 class SpotifyPreviewFinder:
-    def __init__(self, client_id: str, client_secret: str):
-        """Initialize with Spotify credentials"""
+    def __init__(self, client_id: str, client_secret: str, race_strategies: bool = PREVIEW_FINDER_RACE,
+                 deadline: float = PREVIEW_FINDER_DEADLINE):
+        """
+        Initialize with Spotify credentials
+        
+        Args:
+            client_id: Spotify app client ID
+            client_secret: Spotify app client secret
+            race_strategies: Run the market, similar-track and album lookups
+                concurrently instead of one after another
+            deadline: Seconds allowed for alternative preview lookups per track
+        """
         self.client_id = client_id
         self.client_secret = client_secret
+        self.race_strategies = race_strategies
+        self.deadline = deadline
         self.sp = None
         self._authenticate()
     
     def _authenticate(self):
-        """Authenticate with Spotify API"""
+        """Authenticate with Spotify API (the app token and client are shared process-wide)"""
         try:
-            from spotipy.oauth2 import SpotifyClientCredentials
-            auth_manager = SpotifyClientCredentials(
-                client_id=self.client_id,
-                client_secret=self.client_secret
-            )
-            self.sp = spotipy.Spotify(auth_manager=auth_manager)
+            self.sp = get_app_spotify_client(self.client_id, self.client_secret)
         except Exception as e:
             print(f"Authentication failed: {e}")
             self.sp = None
@@ -47,6 +120,14 @@ class SpotifyPreviewFinder:
                 "error": "Not authenticated with Spotify API"
             }
         
+        # Results are shared through the preview cache; a search where no result
+        # has any preview URL is cached as a (shorter-lived) negative entry, but
+        # only if every lookup behind it finished without a transient error
+        cache_key = f"finder:{normalize(song_name)}|{normalize(artist_name)}|{limit}"
+        cached = preview_cache.get(cache_key)
+        if cached is not MISS:
+            return copy.deepcopy(cached)
+        
         try:
             # Build search query
             if artist_name:
@@ -63,16 +144,25 @@ class SpotifyPreviewFinder:
             )
             
             tracks = []
+            complete = True
             for item in results['tracks']['items']:
                 track_info = self._extract_track_info(item)
-                if track_info:
-                    tracks.append(track_info)
+                if track_info is None:
+                    complete = False
+                    continue
+                if track_info.pop("_failures"):
+                    complete = False
+                tracks.append(track_info)
             
-            return {
+            result = {
                 "success": True,
                 "searchQuery": search_query,
                 "results": tracks
             }
+            has_preview = any(track["previewUrls"] for track in tracks)
+            if has_preview or complete:
+                preview_cache.set(cache_key, copy.deepcopy(result), negative=not has_preview)
+            return result
             
         except Exception as e:
             return {
@@ -81,7 +171,12 @@ class SpotifyPreviewFinder:
             }
     
     def _extract_track_info(self, track_item: Dict) -> Optional[Dict]:
-        """Extract track information and find preview URLs"""
+        """
+        Extract track information and find preview URLs
+        
+        The result's "_failures" lists transient errors (and timeouts) from
+        the alternative lookups, so a miss can be told apart from a failure.
+        """
         try:
             # Basic track info
             track_info = {
@@ -93,7 +188,8 @@ class SpotifyPreviewFinder:
                 "popularity": track_item['popularity'],
                 "durationMs": track_item['duration_ms'],
                 "artists": [artist['name'] for artist in track_item['artists']],
-                "previewUrls": []
+                "previewUrls": [],
+                "_failures": [],
             }
             
             # Check for official preview URL
@@ -116,52 +212,66 @@ class SpotifyPreviewFinder:
     
     def _find_alternative_preview_urls(self, track_info: Dict) -> List[Dict]:
         """Find alternative preview URLs using various methods"""
-        alternative_urls = []
+        strategies = [self._probe_markets, self._probe_similar_tracks, self._probe_album_tracks]
         
         try:
-            # Method 1: Try different markets
-            markets = ['US', 'GB', 'CA', 'AU', 'DE', 'FR', 'JP']
-            for market in markets:
-                try:
-                    track = self.sp.track(track_info['trackId'], market=market)
-                    if track.get('preview_url'):
-                        alternative_urls.append({
-                            "url": track['preview_url'],
-                            "type": "market_alternative",
-                            "source": f"spotify_{market.lower()}"
-                        })
-                        break  # Found one, no need to check more markets
-                except:
-                    continue
-            
-            # Method 2: Try searching for similar tracks
-            if not alternative_urls:
-                similar_tracks = self._find_similar_tracks(track_info)
-                for similar in similar_tracks:
-                    if similar.get('preview_url'):
-                        alternative_urls.append({
-                            "url": similar['preview_url'],
-                            "type": "similar_track",
-                            "source": "spotify_similar"
-                        })
-                        break
-            
-            # Method 3: Try album tracks
-            if not alternative_urls:
-                album_tracks = self._find_album_tracks(track_info)
-                for album_track in album_tracks:
-                    if album_track.get('preview_url'):
-                        alternative_urls.append({
-                            "url": album_track['preview_url'],
-                            "type": "album_track",
-                            "source": "spotify_album"
-                        })
+            if self.race_strategies:
+                # Run all three methods at once; the first one to find a URL wins
+                found = _first_hit(_strategy_pool, [lambda s=s: s(track_info) for s in strategies], self.deadline,
+                                   track_info["_failures"])
+            else:
+                # Method 1 (markets), then 2 (similar tracks), then 3 (album tracks)
+                found = None
+                for strategy in strategies:
+                    found = strategy(track_info)
+                    if found:
                         break
-            
         except Exception as e:
             print(f"Error finding alternative URLs: {e}")
+            _record_failure(track_info, e)
+            found = None
         
-        return alternative_urls
+        return [found] if found else []
+    
+    def _probe_markets(self, track_info: Dict) -> Optional[Dict]:
+        """Method 1: look the track up in several markets at once, keeping the first preview found"""
+        def probe(market):
+            try:
+                track = self.sp.track(track_info['trackId'], market=market)
+            except Exception as e:
+                _record_failure(track_info, e)
+                return None
+            if track.get('preview_url'):
+                return {
+                    "url": track['preview_url'],
+                    "type": "market_alternative",
+                    "source": f"spotify_{market.lower()}"
+                }
+            return None
+        
+        return _first_hit(_probe_pool, [lambda m=m: probe(m) for m in MARKETS], self.deadline, track_info["_failures"])
+    
+    def _probe_similar_tracks(self, track_info: Dict) -> Optional[Dict]:
+        """Method 2: take a preview from a similar track"""
+        for similar in self._find_similar_tracks(track_info):
+            if similar.get('preview_url'):
+                return {
+                    "url": similar['preview_url'],
+                    "type": "similar_track",
+                    "source": "spotify_similar"
+                }
+        return None
+    
+    def _probe_album_tracks(self, track_info: Dict) -> Optional[Dict]:
+        """Method 3: take a preview from another track on the same album"""
+        for album_track in self._find_album_tracks(track_info):
+            if album_track.get('preview_url'):
+                return {
+                    "url": album_track['preview_url'],
+                    "type": "album_track",
+                    "source": "spotify_album"
+                }
+        return None
     
     def _find_similar_tracks(self, track_info: Dict) -> List[Dict]:
         """Find similar tracks that might have preview URLs"""
@@ -184,6 +294,7 @@ class SpotifyPreviewFinder:
             
         except Exception as e:
             print(f"Error finding similar tracks: {e}")
+            _record_failure(track_info, e)
             return []
     
     def _find_album_tracks(self, track_info: Dict) -> List[Dict]:
@@ -195,8 +306,21 @@ class SpotifyPreviewFinder:
             
         except Exception as e:
             print(f"Error finding album tracks: {e}")
+            _record_failure(track_info, e)
             return []
 
+_finders = {}
+_finders_lock = threading.Lock()
+
+def get_preview_finder(client_id: str, client_secret: str) -> SpotifyPreviewFinder:
+    """Return the long-lived finder for these credentials, creating it on first use"""
+    with _finders_lock:
+        finder = _finders.get((client_id, client_secret))
+        if finder is None or not finder.sp:
+            finder = SpotifyPreviewFinder(client_id, client_secret)
+            _finders[(client_id, client_secret)] = finder
+        return finder
+
 def find_preview_urls_for_track(track_name: str, artist_name: str = None, limit: int = 3) -> Dict:
     """
     Convenience function to find preview URLs for a track
@@ -218,22 +342,4 @@ def find_preview_urls_for_track(track_name: str, artist_name: str = None, limit:
             "error": "Spotify credentials not found in environment variables"
         }
     
-    finder = SpotifyPreviewFinder(client_id, client_secret)
-    return finder.find_preview_urls(track_name, artist_name, limit)
-
-# Example usage
-if __name__ == "__main__":
-    # Test the preview finder
-    result = find_preview_urls_for_track("Shape of You", "Ed Sheeran", 2)
-    
-    if result["success"]:
-        print(f"Search Query: {result['searchQuery']}")
-        for track in result["results"]:
-            print(f"\nTrack: {track['name']}")
-            print(f"Album: {track['albumName']}")
-            print(f"Popularity: {track['popularity']}")
-            print("Preview URLs:")
-            for preview in track['previewUrls']:
-                print(f"  - {preview['url']} ({preview['type']})")
-    else:
-        print(f"Error: {result['error']}") 
\ No newline at end of file
+    return get_preview_finder(client_id, client_secret).find_preview_urls(track_name, artist_name, limit)
@@ -0,0 +1,111 @@
+"""
+Client for the Node.js preview finder service (NameThat/preview_finder_server.js)
+
+Definitive answers (a preview URL, or "no preview exists") are remembered in
+the shared preview cache; service errors and timeouts are not.
+"""
+
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+from .preview_cache import MISS, preview_cache, preview_key
+from .spotify_client import build_http_session
+from .tracks import Track
+
+PREVIEW_SERVICE_URL = os.getenv("PREVIEW_SERVICE_URL", "http://localhost:3001")
+PREVIEW_SERVICE_TIMEOUT = 5
+# Must not exceed MAX_BATCH_SIZE in preview_finder_server.js
+MAX_BATCH_SIZE = 200
+
+# Keep-alive pool for the local service; no retries, a failed lookup just
+# counts as "no preview" for this request
+_session = build_http_session(retries=0)
+
+
+def lookup_preview(track_name: str, artist_name: str) -> Optional[str]:
+    """
+    Return a track's preview URL from the cache or the preview service
+
+    Raises requests/JSON errors if the service can't be reached, so callers
+    can tell "no preview" apart from "service down".
+    """
+    key = preview_key(track_name, artist_name)
+    cached = preview_cache.get(key)
+    if cached is not MISS:
+        return cached
+
+    resp = _session.get(
+        f"{PREVIEW_SERVICE_URL}/preview",
+        params={"track": track_name, "artist": artist_name},
+        timeout=PREVIEW_SERVICE_TIMEOUT
+    )
+    preview = resp.json().get("preview") or None
+    if preview:
+        preview_cache.set(key, preview)
+    elif resp.status_code == 404:
+        preview_cache.set(key, None, negative=True)
+    return preview
+
+
+def resolve_preview(track_name: str, artist_name: str) -> Optional[str]:
+    """Ask the preview service for a track's preview URL, returning None on any failure."""
+    try:
+        return lookup_preview(track_name, artist_name)
+    except Exception:
+        return None
+
+
+def resolve_previews(pairs: List[Tuple[str, str]]) -> Iterator[Tuple[int, Optional[str]]]:
+    """
+    Resolve many (track name, artist name) pairs through the batch endpoint
+
+    Args:
+        pairs: (track name, artist name) tuples
+
+    Yields:
+        (index into pairs, preview URL or None) as each lookup completes,
+        exactly once per pair; cached answers come first
+    """
+    misses = []
+    for i, (track, artist) in enumerate(pairs):
+        cached = preview_cache.get(preview_key(track, artist))
+        if cached is MISS:
+            misses.append(i)
+        else:
+            yield i, cached
+
+    for start in range(0, len(misses), MAX_BATCH_SIZE):
+        chunk = misses[start:start + MAX_BATCH_SIZE]
+        pending = set(range(len(chunk)))
+        try:
+            # The timeout applies between streamed lines, not to the whole batch
+            with _session.post(
+                f"{PREVIEW_SERVICE_URL}/preview/batch",
+                json={"items": [{"track": pairs[i][0], "artist": pairs[i][1]} for i in chunk]},
+                stream=True,
+                timeout=PREVIEW_SERVICE_TIMEOUT
+            ) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    index = result.get("index")
+                    if index not in pending:
+                        continue
+                    pending.discard(index)
+                    preview = result.get("preview") or None
+                    # Lines with an "error" are lookup failures, not a known miss
+                    if "error" not in result:
+                        preview_cache.set(preview_key(*pairs[chunk[index]]), preview, negative=not preview)
+                    yield chunk[index], preview
+        except Exception as e:
+            print(f"Batch preview resolution failed: {e}")
+        for index in sorted(pending):
+            yield chunk[index], None
+
+
+def track_artist_pair(track: Track) -> Tuple[str, str]:
+    """Return the (track name, first artist name) pair used to look up a track's preview."""
+    return track.name, track.first_artist
@@ -0,0 +1,132 @@
+"""
+Outbound rate limiting for Spotify
+
+All Spotify traffic in a process draws from one token bucket
+(SPOTIFY_RATE_LIMIT requests per second, bursts of SPOTIFY_RATE_BURST). A
+429 pauses the whole bucket for the response's Retry-After and halves its
+rate, which then creeps back up on successful calls, so a busy room slows
+down instead of failing requests.
+
+If SPOTIFY_RATE_LIMIT_CACHE names a Django cache alias shared by all
+workers (e.g. Redis or memcached), the per-second budget and the 429 pause
+are also enforced across processes through that cache.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+from django.core.cache import caches
+
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "20"))
+SPOTIFY_RATE_BURST = int(os.getenv("SPOTIFY_RATE_BURST", "20"))
+SPOTIFY_RATE_LIMIT_CACHE = os.getenv("SPOTIFY_RATE_LIMIT_CACHE", "")
+# A 429 asking us to wait longer than this is passed back to the caller
+SPOTIFY_MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "30"))
+SPOTIFY_RATE_LIMIT_RETRIES = int(os.getenv("SPOTIFY_RATE_LIMIT_RETRIES", "3"))
+
+# Adaptive backoff: multiply the rate by this on every 429, never going below
+# MIN_RATE_FRACTION of the configured rate, and win back RECOVERY_STEP of it
+# per second without a 429
+BACKOFF_FACTOR = 0.5
+MIN_RATE_FRACTION = 0.1
+RECOVERY_STEP = 0.05
+# Used when a 429 has no usable Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+
+_PAUSE_KEY = "spotify-rate:paused-until"
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Seconds to wait for a Retry-After header value (Spotify always sends seconds)."""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class RateLimiter:
+    """Token bucket with a global pause and AIMD rate adjustment."""
+
+    def __init__(self, rate: float = SPOTIFY_RATE_LIMIT, burst: int = SPOTIFY_RATE_BURST,
+                 cache_alias: str = SPOTIFY_RATE_LIMIT_CACHE):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.cache_alias = cache_alias
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0  # wall clock, so it can be shared with other processes
+        self._lock = threading.Lock()
+
+    @property
+    def _shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + elapsed * self.max_rate * RECOVERY_STEP)
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - time.time()
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        wait = 0
+                    else:
+                        wait = (1 - self._tokens) / self.rate
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            wait = self._shared_wait()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _shared_wait(self) -> float:
+        """Seconds until the cross-process budget allows another request (0 if it does now)."""
+        shared = self._shared
+        if shared is None:
+            return 0.0
+        try:
+            paused_until = shared.get(_PAUSE_KEY) or 0
+            if paused_until > time.time():
+                return paused_until - time.time()
+            now = time.time()
+            second = int(now)
+            key = f"spotify-rate:{second}"
+            shared.add(key, 0, timeout=5)
+            if shared.incr(key) <= self.max_rate:
+                return 0.0
+            return math.ceil(now) - now or 0.01
+        except Exception as e:
+            # Never let the shared store take Spotify traffic down with it
+            print(f"Shared rate limit check failed: {e}")
+            return 0.0
+
+    def backoff(self, retry_after: float) -> None:
+        """Record a 429: pause everyone for retry_after seconds and slow down."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + retry_after)
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate * BACKOFF_FACTOR)
+            self._tokens = min(self._tokens, 0.0)
+            paused_until = self._paused_until
+        shared = self._shared
+        if shared is not None:
+            try:
+                shared.set(_PAUSE_KEY, paused_until, timeout=math.ceil(retry_after) + 1)
+            except Exception as e:
+                print(f"Failed to share rate limit pause: {e}")
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,284 @@
+"""
+Shared HTTP plumbing for Spotify calls
+
+Every spotipy client, OAuth manager and the preview finder go through one
+process-wide keep-alive connection pool instead of opening (and TLS
+handshaking) a new connection per request. Requests to Spotify's hosts on
+that pool are paced by the shared rate limiter (see rate_limiter.py),
+revalidated against Spotify's ETags (see http_cache.py), and identical GETs
+in flight at the same time share one upstream request.
+"""
+
+import copy
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+import spotipy
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
+
+from . import http_cache
+from .rate_limiter import (SPOTIFY_MAX_RETRY_AFTER, SPOTIFY_RATE_LIMIT_RETRIES, RateLimiter,
+                           parse_retry_after, rate_limiter)
+from .singleflight import SingleFlight
+
+SPOTIFY_POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", "20"))
+SPOTIFY_RETRIES = int(os.getenv("SPOTIFY_RETRIES", "3"))
+SPOTIFY_BACKOFF_FACTOR = float(os.getenv("SPOTIFY_BACKOFF_FACTOR", "0.3"))
+SPOTIFY_REQUESTS_TIMEOUT = int(os.getenv("SPOTIFY_REQUESTS_TIMEOUT", "5"))
+# Renew the shared app token in the background once it has less than this left
+APP_TOKEN_REFRESH_MARGIN = int(os.getenv("APP_TOKEN_REFRESH_MARGIN", "300"))
+
+# Same statuses spotipy retries by default; 429 is left to RateLimitedAdapter
+# when a limiter is in place so the pause applies to every thread, not just one
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMITED_HOSTS = ("api.spotify.com", "accounts.spotify.com")
+
+
+class SharedSession(requests.Session):
+    """
+    A requests.Session that lives for the whole process
+
+    spotipy.Spotify and the spotipy auth managers close their session in
+    __del__, which would drop every pooled connection each time a per-request
+    client is garbage collected, so close() is a no-op here.
+    """
+
+    def close(self):
+        pass
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that takes a limiter token before each request to Spotify
+
+    A 429 pauses the limiter for its Retry-After and the request is sent
+    again (up to SPOTIFY_RATE_LIMIT_RETRIES times) rather than failing, unless
+    Spotify asks for a wait longer than SPOTIFY_MAX_RETRY_AFTER.
+
+    With http_cache, GETs are also revalidated with If-None-Match against
+    the stored response and fall back to it when Spotify fails; a 429 on a
+    read that has a stale response to fall back to is answered with it at
+    once instead of being retried.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, http_cache: bool = False, **kwargs):
+        self.limiter = limiter
+        self.http_cache = http_cache
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if urlparse(request.url).hostname not in RATE_LIMITED_HOSTS:
+            return super().send(request, **kwargs)
+        if not self.http_cache or request.method != "GET" or "Range" in request.headers:
+            return self._send_limited(request, **kwargs)
+
+        entry = http_cache.lookup(request)
+        if entry:
+            request.headers["If-None-Match"] = entry["etag"]
+        try:
+            response = self._send_limited(request, retry=not http_cache.can_serve_stale(entry, request), **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if http_cache.can_serve_stale(entry, request):
+                print(f"Spotify unreachable ({e}), serving stale {urlparse(request.url).path}")
+                return http_cache.cached_response(entry, request, stale=True)
+            raise
+
+        if response.status_code == 304 and entry:
+            response.close()
+            return http_cache.cached_response(entry, request)
+        if (response.status_code >= 500 or response.status_code == 429) \
+                and http_cache.can_serve_stale(entry, request):
+            print(f"Spotify returned {response.status_code}, serving stale {urlparse(request.url).path}")
+            response.close()
+            return http_cache.cached_response(entry, request, stale=True)
+        http_cache.store(request, response)
+        return response
+
+    def _send_limited(self, request, retry: bool = True, **kwargs):
+        if self.limiter is None:
+            return super().send(request, **kwargs)
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            response = super().send(request, **kwargs)
+            if response.status_code != 429:
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.limiter.backoff(min(retry_after, SPOTIFY_MAX_RETRY_AFTER))
+            if not retry or retry_after > SPOTIFY_MAX_RETRY_AFTER or attempt >= SPOTIFY_RATE_LIMIT_RETRIES:
+                return response
+            print(f"Spotify rate limited {request.method} {urlparse(request.url).path}, retrying in {retry_after}s")
+            response.close()
+            attempt += 1
+
+
+def build_http_session(pool_size: int = SPOTIFY_POOL_SIZE, retries: int = SPOTIFY_RETRIES,
+                       backoff_factor: float = SPOTIFY_BACKOFF_FACTOR,
+                       limiter: Optional[RateLimiter] = None, http_cache: bool = False) -> requests.Session:
+    """Create a keep-alive session with a bounded connection pool and retry policy."""
+    statuses = RETRY_STATUSES if limiter is None else tuple(s for s in RETRY_STATUSES if s != 429)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=False,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=statuses,
+        # urllib3 would otherwise retry any 429 carrying Retry-After on its own
+        respect_retry_after_header=limiter is None,
+        raise_on_status=False,
+    )
+    adapter = RateLimitedAdapter(limiter, http_cache, pool_connections=pool_size, pool_maxsize=pool_size,
+                                 max_retries=retry)
+    session = SharedSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Return the process-wide session used for all Spotify traffic."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_http_session(limiter=rate_limiter, http_cache=True)
+    return _session
+
+
+_reads = SingleFlight()
+
+
+class CoalescingSpotify(spotipy.Spotify):
+    """
+    spotipy client whose GETs are deduplicated process-wide
+
+    Concurrent reads of the same endpoint with the same parameters and the
+    same credentials (e.g. a room of players opening one playlist) make one
+    upstream request; each waiter gets its own copy of the response.
+    """
+
+    def _get(self, url, args=None, payload=None, **kwargs):
+        if args:
+            kwargs.update(args)
+        if payload is not None:
+            return self._internal_call("GET", url, payload, kwargs)
+        # The bearer token is the auth scope: never share a response across credentials
+        key = (url if url.startswith("http") else self.prefix + url, tuple(sorted((k, str(v)) for k, v in kwargs.items())),
+               self._auth_headers().get("Authorization"))
+        return _reads.do(key, lambda: self._internal_call("GET", url, None, kwargs), share=copy.deepcopy)
+
+
+def get_spotify_client(token: Optional[str] = None, auth_manager=None) -> spotipy.Spotify:
+    """Build a spotipy client (cheap) on top of the shared connection pool."""
+    return CoalescingSpotify(
+        auth=token,
+        auth_manager=auth_manager,
+        requests_session=get_http_session(),
+        requests_timeout=SPOTIFY_REQUESTS_TIMEOUT,
+    )
+
+
+class SharedClientCredentials(SpotifyClientCredentials):
+    """
+    Client-credentials manager meant to be shared by the whole process
+
+    Holds one app token in memory (never the .cache file, which holds the
+    user's OAuth token). Only one thread fetches a token at a time, and once
+    the token is within APP_TOKEN_REFRESH_MARGIN of expiring it is renewed in
+    the background while callers keep using the current one.
+    """
+
+    def __init__(self, client_id: str, client_secret: str):
+        super().__init__(
+            client_id=client_id,
+            client_secret=client_secret,
+            requests_session=get_http_session(),
+            requests_timeout=SPOTIFY_REQUESTS_TIMEOUT,
+            cache_handler=MemoryCacheHandler(),
+        )
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_access_token(self, as_dict=False, check_cache=True):
+        token_info = self.cache_handler.get_cached_token()
+        if not check_cache or not token_info or self.is_token_expired(token_info):
+            token_info = self._fetch(min_remaining=None if check_cache else float("inf"))
+        elif token_info["expires_at"] - time.time() < APP_TOKEN_REFRESH_MARGIN:
+            self._refresh_in_background()
+        return token_info if as_dict else token_info["access_token"]
+
+    def _fetch(self, min_remaining: Optional[float]) -> Dict:
+        """Fetch a new token unless another thread already got one with min_remaining seconds left."""
+        with self._lock:
+            token_info = self.cache_handler.get_cached_token()
+            if token_info:
+                remaining = token_info["expires_at"] - time.time()
+                fresh_enough = remaining >= min_remaining if min_remaining is not None \
+                    else not self.is_token_expired(token_info)
+                if fresh_enough:
+                    return token_info
+            token_info = self._add_custom_values_to_token_info(self._request_access_token())
+            self.cache_handler.save_token_to_cache(token_info)
+            return token_info
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._fetch(min_remaining=APP_TOKEN_REFRESH_MARGIN)
+            except Exception as e:
+                print(f"Background app token refresh failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="app-token-refresh", daemon=True).start()
+
+
+_app_clients = {}
+_app_clients_lock = threading.Lock()
+
+
+def get_app_spotify_client(client_id: Optional[str] = None, client_secret: Optional[str] = None) -> spotipy.Spotify:
+    """
+    Return the process-wide client-credentials (app) client for these credentials
+
+    Defaults to SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET. Only catalog
+    endpoints work with an app token; nothing user-specific.
+    """
+    client_id = client_id or os.getenv("SPOTIFY_CLIENT_ID")
+    client_secret = client_secret or os.getenv("SPOTIFY_CLIENT_SECRET")
+    with _app_clients_lock:
+        client = _app_clients.get((client_id, client_secret))
+        if client is None:
+            client = get_spotify_client(auth_manager=SharedClientCredentials(client_id, client_secret))
+            _app_clients[(client_id, client_secret)] = client
+        return client
+
+
+def run_blocking(func, *args, **kwargs):
+    """
+    Await a blocking call (spotipy, cache, preview service) from an async view
+
+    Runs in the default thread pool rather than Django's single sync thread,
+    so independent calls can be gathered concurrently. Don't use it for
+    anything touching the database.
+    """
+    return sync_to_async(func, thread_sensitive=False)(*args, **kwargs)
@@ -1,3 +1,527 @@
-from django.test import TestCase
+import io
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+import spotipy
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from requests.adapters import HTTPAdapter
+
+from . import audio_cache, preview_finder, rate_limiter as rate_limiter_module, views
+from .library import LIBRARY_PAGE_SIZE, get_library_tracks
+from .preview_cache import MISS, PreviewCache
+from .preview_finder import SpotifyPreviewFinder
+from .rate_limiter import (BACKOFF_FACTOR, DEFAULT_RETRY_AFTER, MIN_RATE_FRACTION, SPOTIFY_MAX_RETRY_AFTER,
+                           SPOTIFY_RATE_LIMIT_RETRIES, RateLimiter, parse_retry_after)
+from .spotify_client import CoalescingSpotify, RateLimitedAdapter
+
+LOCMEM_CACHES = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+    for alias in ("default", "playlists", "sessions", "spotify_http", "shared-rate")
+}
+
+
+class FakeClock:
+    """Stands in for the time module: sleep() advances both clocks instead of blocking."""
+
+    def __init__(self, start=1000.5):
+        self.now = start
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limiter_module, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_served_without_waiting(self):
+        limiter = RateLimiter(rate=10, burst=3, cache_alias="")
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_empty_bucket_waits_for_the_next_token(self):
+        limiter = RateLimiter(rate=10, burst=1, cache_alias="")
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [0.1])
+
+    def test_backoff_pauses_and_halves_the_rate(self):
+        limiter = RateLimiter(rate=10, burst=5, cache_alias="")
+        limiter.backoff(2.0)
+        self.assertEqual(limiter.rate, 10 * BACKOFF_FACTOR)
+        limiter.acquire()
+        self.assertGreaterEqual(sum(self.clock.sleeps), 2.0)
+
+    def test_backoff_never_drops_below_the_floor(self):
+        limiter = RateLimiter(rate=10, burst=5, cache_alias="")
+        for _ in range(20):
+            limiter.backoff(0)
+        self.assertAlmostEqual(limiter.rate, 10 * MIN_RATE_FRACTION)
+
+    def test_rate_recovers_without_429s(self):
+        limiter = RateLimiter(rate=10, burst=5, cache_alias="")
+        limiter.backoff(0)
+        self.clock.now += 5
+        limiter.acquire()
+        self.assertTrue(10 * BACKOFF_FACTOR < limiter.rate < 10)
+        self.clock.now += 60
+        limiter.acquire()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("-5"), 0.0)
+        self.assertEqual(parse_retry_after(None), DEFAULT_RETRY_AFTER)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), DEFAULT_RETRY_AFTER)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SharedRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limiter_module, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        caches["shared-rate"].clear()
+
+    def test_budget_is_shared_across_limiters(self):
+        # Two processes' limiters, each with plenty of local tokens
+        first = RateLimiter(rate=2, burst=10, cache_alias="shared-rate")
+        second = RateLimiter(rate=2, burst=10, cache_alias="shared-rate")
+        first.acquire()
+        second.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        # The third request this second waits for the next one
+        first.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_pause_is_shared_across_limiters(self):
+        first = RateLimiter(rate=10, burst=10, cache_alias="shared-rate")
+        second = RateLimiter(rate=10, burst=10, cache_alias="shared-rate")
+        first.backoff(3.0)
+        second.acquire()
+        self.assertAlmostEqual(sum(self.clock.sleeps), 3.0)
+
+
+class StubLimiter:
+    def __init__(self):
+        self.acquired = 0
+        self.backoffs = []
+
+    def acquire(self):
+        self.acquired += 1
+
+    def backoff(self, retry_after):
+        self.backoffs.append(retry_after)
+
+
+def _response(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO(b"")
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+class RateLimitedAdapterTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = StubLimiter()
+        self.adapter = RateLimitedAdapter(self.limiter)
+
+    def _send(self, responses, url="https://api.spotify.com/v1/me"):
+        request = requests.Request("GET", url).prepare()
+        with mock.patch.object(HTTPAdapter, "send", side_effect=responses) as send:
+            response = self.adapter.send(request)
+        return response, send.call_count
+
+    def test_429_is_retried_after_backing_off(self):
+        response, sends = self._send([_response(429, retry_after=2), _response(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sends, 2)
+        self.assertEqual(self.limiter.acquired, 2)
+        self.assertEqual(self.limiter.backoffs, [2.0])
+
+    def test_long_retry_after_is_returned_to_the_caller(self):
+        response, sends = self._send([_response(429, retry_after=SPOTIFY_MAX_RETRY_AFTER + 1), _response(200)])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(sends, 1)
+        # The limiter still pauses, but only for the capped wait
+        self.assertEqual(self.limiter.backoffs, [SPOTIFY_MAX_RETRY_AFTER])
+
+    def test_retries_stop_after_the_limit(self):
+        attempts = SPOTIFY_RATE_LIMIT_RETRIES + 1
+        response, sends = self._send([_response(429, retry_after=1) for _ in range(attempts + 1)])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(sends, attempts)
+        self.assertEqual(len(self.limiter.backoffs), attempts)
+
+    def test_other_hosts_skip_the_limiter(self):
+        response, sends = self._send([_response(429, retry_after=1)], url="http://localhost:3001/preview")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(sends, 1)
+        self.assertEqual(self.limiter.acquired, 0)
+
+
+class FakeLibrary:
+    """current_user_saved_tracks over a newest-first list of saved items, recording requested offsets."""
+
+    def __init__(self, count):
+        self.items = [self.item(f"t{i}", f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}Z") for i in range(count)][::-1]
+        self.offsets = []
+
+    @staticmethod
+    def item(track_id, added_at):
+        return {"added_at": added_at, "track": {"id": track_id, "name": track_id, "artists": [{"name": "a"}]}}
+
+    def current_user_saved_tracks(self, limit=20, offset=0):
+        self.offsets.append(offset)
+        return {"total": len(self.items), "items": self.items[offset:offset + limit]}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LibrarySyncTests(SimpleTestCase):
+    def setUp(self):
+        caches["playlists"].clear()
+        self.sp = FakeLibrary(230)
+
+    def _sync(self):
+        self.sp.offsets = []
+        return [track.id for track in get_library_tracks(self.sp, "session")]
+
+    def _expected(self):
+        return [item["track"]["id"] for item in self.sp.items]
+
+    def test_unchanged_library_costs_one_page(self):
+        self.assertEqual(self._sync(), self._expected())
+        self.assertEqual(self._sync(), self._expected())
+        self.assertEqual(self.sp.offsets, [0])
+
+    def test_new_saves_are_prepended_without_a_full_reload(self):
+        self._sync()
+        self.sp.items = [FakeLibrary.item(f"n{i}", "2024-01-02T00:00:00Z") for i in range(60)] + self.sp.items
+        self.assertEqual(self._sync(), self._expected())
+        # Walked until the old watermark, not through the whole library
+        self.assertEqual(self.sp.offsets, [0, LIBRARY_PAGE_SIZE])
+
+    def test_saves_in_the_watermark_second_are_not_missed(self):
+        self._sync()
+        self.sp.items = [FakeLibrary.item("n0", "2024-01-02T00:00:00Z")] + self.sp.items
+        self._sync()
+        # A second save in the same second as the new watermark
+        self.sp.items = [FakeLibrary.item("n1", "2024-01-02T00:00:00Z")] + self.sp.items
+        self.assertEqual(self._sync(), self._expected())
+        self.assertEqual(self.sp.offsets, [0])
+
+    def test_removal_triggers_a_full_reload(self):
+        self._sync()
+        del self.sp.items[100]
+        self.assertEqual(self._sync(), self._expected())
+        self.assertEqual(sorted(self.sp.offsets), list(range(0, 230, LIBRARY_PAGE_SIZE)))
+
+    def test_removal_hidden_by_an_addition_is_caught(self):
+        self._sync()
+        del self.sp.items[100]
+        self.sp.items = [FakeLibrary.item("n0", "2024-01-02T00:00:00Z")] + self.sp.items
+        self.assertEqual(self._sync(), self._expected())
+
+    def test_items_without_a_track_still_count(self):
+        self.sp.items[5]["track"] = None
+        self.assertEqual(len(self._sync()), 229)
+        self._sync()
+        self.assertEqual(self.sp.offsets, [0])
+
+
+class CoalescingSpotifyTests(SimpleTestCase):
+    """Concurrent identical reads share one upstream call; the stub holds it open until every caller has arrived."""
+
+    def setUp(self):
+        self.upstream = []
+        self.release = threading.Event()
+        self.error = None
+
+        def internal_call(client, method, url, payload, params):
+            self.upstream.append((client._auth, url, dict(params)))
+            self.release.wait(5)
+            if self.error:
+                raise self.error
+            return {"id": url.rsplit("/", 1)[-1], "params": dict(params)}
+
+        patcher = mock.patch.object(CoalescingSpotify, "_internal_call", internal_call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run_concurrently(self, calls):
+        results = [None] * len(calls)
+
+        def run(i, call):
+            try:
+                results[i] = call()
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        # Give every caller time to reach the in-flight call before it completes
+        time.sleep(0.2)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_identical_gets_share_one_upstream_call(self):
+        sp = CoalescingSpotify(auth="token-a")
+        results = self._run_concurrently([lambda: sp.track("abc")] * 5)
+        self.assertEqual(len(self.upstream), 1)
+        self.assertEqual([result["id"] for result in results], ["abc"] * 5)
+        # Every caller gets its own copy
+        results[0]["id"] = "changed"
+        self.assertEqual(results[1]["id"], "abc")
+
+    def test_other_tokens_never_share_a_response(self):
+        first, second = CoalescingSpotify(auth="token-a"), CoalescingSpotify(auth="token-b")
+        self._run_concurrently([lambda: first.track("abc"), lambda: second.track("abc")])
+        self.assertEqual(sorted(auth for auth, _, _ in self.upstream), ["token-a", "token-b"])
+
+    def test_other_params_are_separate_calls(self):
+        sp = CoalescingSpotify(auth="token-a")
+        self._run_concurrently([lambda: sp.playlist("p", fields="name"), lambda: sp.playlist("p", fields="id")])
+        self.assertEqual(len(self.upstream), 2)
+
+    def test_leader_error_reaches_every_waiter(self):
+        self.error = spotipy.SpotifyException(404, -1, "not found")
+        sp = CoalescingSpotify(auth="token-a")
+        results = self._run_concurrently([lambda: sp.track("abc")] * 3)
+        self.assertEqual(len(self.upstream), 1)
+        for result in results:
+            self.assertIsInstance(result, spotipy.SpotifyException)
+
+
+PREVIEW_ID = "abcdef0123456789"
+PREVIEW_BYTES = bytes(range(100))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PreviewAudioTests(SimpleTestCase):
+    """preview_audio served from a pre-seeded byte cache, so nothing is downloaded."""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        (Path(cache_dir.name) / f"{PREVIEW_ID}.mp3").write_bytes(PREVIEW_BYTES)
+        settings_override = override_settings(PREVIEW_AUDIO_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = reverse("preview_audio", args=[PREVIEW_ID])
+        self.etag = f'"{PREVIEW_ID}"'
+        self.token = "token"
+
+        async def resolve_access_token(request):
+            return self.token
+
+        patcher = mock.patch.object(views, "aresolve_access_token", resolve_access_token)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get(self, **headers):
+        return self.client.get(self.url, headers=headers)
+
+    def assertPartial(self, response, start, end):
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, PREVIEW_BYTES[start:end + 1])
+        self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{len(PREVIEW_BYTES)}")
+
+    def assertFull(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, PREVIEW_BYTES)
+        self.assertNotIn("Content-Range", response)
+
+    def test_full_file(self):
+        response = self._get()
+        self.assertFull(response)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_closed_range(self):
+        self.assertPartial(self._get(Range="bytes=10-19"), 10, 19)
+
+    def test_open_ended_range(self):
+        self.assertPartial(self._get(Range="bytes=90-"), 90, 99)
+
+    def test_range_past_the_end_is_clamped(self):
+        self.assertPartial(self._get(Range="bytes=50-500"), 50, 99)
+
+    def test_suffix_range(self):
+        self.assertPartial(self._get(Range="bytes=-5"), 95, 99)
+        self.assertPartial(self._get(Range="bytes=-500"), 0, 99)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ("bytes=100-", "bytes=20-10", "bytes=-0"):
+            response = self._get(Range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], f"bytes */{len(PREVIEW_BYTES)}")
+
+    def test_multi_range_and_malformed_headers_are_ignored(self):
+        for header in ("bytes=0-1,5-6", "items=0-5", "bytes=-"):
+            self.assertFull(self._get(Range=header))
+
+    def test_if_range(self):
+        self.assertPartial(self._get(Range="bytes=0-9", **{"If-Range": self.etag}), 0, 9)
+        self.assertFull(self._get(Range="bytes=0-9", **{"If-Range": '"something-else"'}))
+
+    def test_if_none_match(self):
+        for header in (self.etag, f'"other", {self.etag}', "*"):
+            response = self._get(**{"If-None-Match": header})
+            self.assertEqual(response.status_code, 304, header)
+            self.assertEqual(response["ETag"], self.etag)
+        self.assertFull(self._get(**{"If-None-Match": '"other"'}))
+
+    def test_invalid_preview_id(self):
+        response = self.client.get(reverse("preview_audio", args=["bad-id!"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_login_is_required(self):
+        self.token = None
+        self.assertEqual(self._get().status_code, 401)
+
+    def test_ids_the_cdn_rejects_are_remembered(self):
+        cdn = mock.Mock()
+        cdn.get.return_value = _response(404)
+        url = reverse("preview_audio", args=["0000missing"])
+        with mock.patch.object(audio_cache, "get_http_session", return_value=cdn):
+            self.assertEqual(self.client.get(url).status_code, 502)
+            self.assertEqual(self.client.get(url).status_code, 502)
+        self.assertEqual(cdn.get.call_count, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StaleOnRateLimitTests(SimpleTestCase):
+    def setUp(self):
+        caches["spotify_http"].clear()
+        self.limiter = StubLimiter()
+        self.adapter = RateLimitedAdapter(self.limiter, http_cache=True)
+
+    def _send(self, responses, url="https://api.spotify.com/v1/me/playlists", token="token-a"):
+        request = requests.Request("GET", url, headers={"Authorization": f"Bearer {token}"}).prepare()
+        with mock.patch.object(HTTPAdapter, "send", side_effect=responses) as send:
+            response = self.adapter.send(request)
+        return response, send.call_count
+
+    def _ok(self, body):
+        response = _response(200)
+        response._content = body
+        response.headers["ETag"] = '"v1"'
+        return response
+
+    def test_429_with_a_stale_entry_is_answered_at_once(self):
+        self._send([self._ok(b'{"items": []}')])
+        response, sends = self._send([_response(429, retry_after=10), _response(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Cache"], "STALE")
+        self.assertEqual(response.content, b'{"items": []}')
+        self.assertEqual(sends, 1)
+        self.assertEqual(self.limiter.backoffs, [10.0])
+
+    def test_429_without_a_stale_entry_is_retried(self):
+        response, sends = self._send([_response(429, retry_after=1), self._ok(b"{}")])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sends, 2)
+
+    def test_me_entries_are_kept_per_user(self):
+        self._send([self._ok(b'"a"')], token="token-a")
+        self._send([self._ok(b'"b"')], token="token-b")
+        response, _ = self._send([_response(503)], token="token-a")
+        self.assertEqual(response.content, b'"a"')
+
+
+class StubFinderClient:
+    """Search finds one track without a preview; every other lookup raises `error` (or sleeps past the deadline)."""
+
+    def __init__(self, error=None, delay=0):
+        self.error = error
+        self.delay = delay
+
+    def search(self, q, type, limit, market):
+        return {"tracks": {"items": [{
+            "name": "s", "id": "t1", "external_urls": {"spotify": "u"}, "popularity": 1, "duration_ms": 1,
+            "album": {"name": "al", "release_date": "2020"}, "artists": [{"name": "b"}], "preview_url": None,
+        }]}}
+
+    def _respond(self, value):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return value
+
+    def track(self, track_id, market=None):
+        return self._respond({"preview_url": None})
+
+    def album_tracks(self, album, market=None):
+        return self._respond({"items": []})
+
+    def audio_features(self, ids):
+        return self._respond([])
+
+
+class PreviewFinderCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = PreviewCache()
+        patcher = mock.patch.object(preview_finder, "preview_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _find(self, client, race=False, deadline=5):
+        with mock.patch.object(preview_finder, "get_app_spotify_client", lambda *args: client):
+            finder = SpotifyPreviewFinder("id", "secret", race_strategies=race, deadline=deadline)
+        return finder.find_preview_urls("s", "b", 1)
+
+    def _cached(self):
+        return self.cache.get("finder:s|b|1")
+
+    def test_clean_miss_is_cached(self):
+        result = self._find(StubFinderClient())
+        self.assertEqual(result["results"][0]["previewUrls"], [])
+        self.assertNotIn("_failures", result["results"][0])
+        self.assertIsNot(self._cached(), MISS)
+
+    def test_definitive_errors_still_count_as_a_miss(self):
+        self._find(StubFinderClient(error=spotipy.SpotifyException(404, -1, "not found")))
+        self.assertIsNot(self._cached(), MISS)
+
+    def test_transient_errors_are_not_cached(self):
+        for status in (429, 503):
+            for race in (False, True):
+                self.cache = PreviewCache()
+                with mock.patch.object(preview_finder, "preview_cache", self.cache):
+                    self._find(StubFinderClient(error=spotipy.SpotifyException(status, -1, "failed")), race=race)
+                    self.assertIs(self._cached(), MISS, (status, race))
+
+    def test_timeouts_are_not_cached(self):
+        self._find(StubFinderClient(delay=0.3), deadline=0.05)
+        self.assertIs(self._cached(), MISS)
+
+    def test_cached_results_are_copies(self):
+        self._find(StubFinderClient())["results"].clear()
+        first = self._find(StubFinderClient())
+        self.assertEqual(len(first["results"]), 1)
+        first["results"].clear()
+        self.assertEqual(len(self._find(StubFinderClient())["results"]), 1)
@@ -0,0 +1,108 @@
+"""
+Proactive token refresh
+
+Tracks the expiry of every token seen on a request and refreshes it
+TOKEN_REFRESH_LEAD seconds before it expires, on a background thread, so
+the request path normally never waits on the accounts service. Sessions
+idle for longer than TOKEN_REFRESH_IDLE_LIMIT are dropped instead of being
+kept alive forever.
+"""
+
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+TOKEN_REFRESH_LEAD = int(os.getenv("TOKEN_REFRESH_LEAD", "300"))
+TOKEN_REFRESH_IDLE_LIMIT = int(os.getenv("TOKEN_REFRESH_IDLE_LIMIT", str(2 * 60 * 60)))
+TOKEN_REFRESH_RETRY_DELAY = 30
+
+
+class _Tracked:
+    def __init__(self, token_info: Dict, last_seen: float):
+        self.token_info = token_info
+        self.expires_at = token_info["expires_at"]
+        self.last_seen = last_seen
+
+
+class TokenRefreshScheduler:
+    """Min-heap of refresh deadlines served by one daemon thread (started on first use)."""
+
+    def __init__(self, refresh: Callable[[str, Dict], Dict], lead: int = TOKEN_REFRESH_LEAD,
+                 idle_limit: int = TOKEN_REFRESH_IDLE_LIMIT):
+        self._refresh_fn = refresh
+        self.lead = lead
+        self.idle_limit = idle_limit
+        self._cond = threading.Condition()
+        self._heap = []  # (refresh_at, session_key, expires_at)
+        self._tracked = {}  # session_key -> _Tracked
+        self._thread = None
+        self._workers = ThreadPoolExecutor(max_workers=4, thread_name_prefix="token-refresh")
+
+    def track(self, session_key: Optional[str], token_info: Optional[Dict]) -> None:
+        """Note that a session used token_info just now, scheduling its refresh if it's new."""
+        self._schedule(session_key, token_info, seen=True)
+
+    def _schedule(self, session_key: Optional[str], token_info: Optional[Dict], seen: bool,
+                  refresh_at: Optional[float] = None) -> None:
+        if not session_key or not token_info or not token_info.get("refresh_token") \
+                or not token_info.get("expires_at"):
+            return
+        now = time.time()
+        with self._cond:
+            tracked = self._tracked.get(session_key)
+            if tracked and tracked.expires_at == token_info["expires_at"] and refresh_at is None:
+                if seen:
+                    tracked.last_seen = now
+                return
+            last_seen = now if seen or tracked is None else tracked.last_seen
+            tracked = _Tracked(token_info, last_seen)
+            self._tracked[session_key] = tracked
+            if refresh_at is None:
+                refresh_at = tracked.expires_at - self.lead
+            heapq.heappush(self._heap, (refresh_at, session_key, tracked.expires_at))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="token-refresh-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _next_due(self):
+        """Block until a tracked token is due, then return (session_key, _Tracked)."""
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                refresh_at, session_key, expires_at = self._heap[0]
+                tracked = self._tracked.get(session_key)
+                if tracked is None or tracked.expires_at != expires_at:
+                    # Superseded by a newer token for the same session
+                    heapq.heappop(self._heap)
+                    continue
+                now = time.time()
+                if refresh_at > now:
+                    self._cond.wait(timeout=refresh_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                if now - tracked.last_seen > self.idle_limit or now >= tracked.expires_at:
+                    # Abandoned session, or retries ran past expiry: stop tracking it
+                    del self._tracked[session_key]
+                    continue
+                return session_key, tracked
+
+    def _run(self) -> None:
+        while True:
+            session_key, tracked = self._next_due()
+            self._workers.submit(self._refresh, session_key, tracked)
+
+    def _refresh(self, session_key: str, tracked: _Tracked) -> None:
+        try:
+            refreshed = self._refresh_fn(session_key, tracked.token_info)
+        except Exception as e:
+            print(f"Background token refresh failed for session {session_key}: {e}")
+            self._schedule(session_key, tracked.token_info, seen=False,
+                           refresh_at=time.time() + TOKEN_REFRESH_RETRY_DELAY)
+            return
+        self._schedule(session_key, refreshed, seen=False)
@@ -0,0 +1,99 @@
+"""
+Spotify token store
+
+Keeps each browser session's Spotify token_info out of the Django session
+row. Tokens are held in a small process-local map in front of a shared
+cache (the "sessions" cache alias), keyed by session key, so read-only
+requests never touch the database and a token is only written when it
+actually changes.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+TOKEN_CACHE_ALIAS = "sessions"
+# How long a process trusts its local copy before re-reading the shared store,
+# which bounds how stale a token refreshed by another worker can look here
+TOKEN_LOCAL_TTL = int(os.getenv("TOKEN_LOCAL_TTL", "60"))
+TOKEN_LOCAL_MAX_ENTRIES = 10000
+
+
+def _cache_key(session_key: str) -> str:
+    return f"spotify-token:{session_key}"
+
+
+class TokenStore:
+    """Process-local token map backed by a shared Django cache."""
+
+    def __init__(self, cache_alias: str = TOKEN_CACHE_ALIAS, local_ttl: int = TOKEN_LOCAL_TTL,
+                 max_local_entries: int = TOKEN_LOCAL_MAX_ENTRIES):
+        self.cache_alias = cache_alias
+        self.local_ttl = local_ttl
+        self.max_local_entries = max_local_entries
+        self._lock = threading.Lock()
+        self._local = OrderedDict()  # session key -> (token_info, loaded_at)
+
+    @property
+    def _backing(self):
+        return caches[self.cache_alias]
+
+    def _remember(self, session_key: str, token_info: Dict) -> None:
+        with self._lock:
+            self._local[session_key] = (token_info, time.monotonic())
+            self._local.move_to_end(session_key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def get(self, session_key: Optional[str], fresh: bool = False) -> Optional[Dict]:
+        """Return the token_info stored for a session, or None; fresh skips the local copy."""
+        if not session_key:
+            return None
+        if not fresh:
+            with self._lock:
+                local = self._local.get(session_key)
+            if local and time.monotonic() - local[1] < self.local_ttl:
+                return local[0]
+
+        token_info = self._backing.get(_cache_key(session_key))
+        if token_info is not None:
+            self._remember(session_key, token_info)
+        return token_info
+
+    def set(self, session_key: str, token_info: Dict) -> bool:
+        """Store token_info for a session; returns False (and writes nothing) if it is unchanged."""
+        with self._lock:
+            local = self._local.get(session_key)
+        if local and local[0] == token_info:
+            return False
+        if self._backing.get(_cache_key(session_key)) == token_info:
+            self._remember(session_key, token_info)
+            return False
+
+        self._backing.set(_cache_key(session_key), token_info, timeout=settings.SESSION_COOKIE_AGE)
+        self._remember(session_key, token_info)
+        return True
+
+
+token_store = TokenStore()
+
+
+def get_request_token_info(request) -> Optional[Dict]:
+    """
+    Return the Spotify token_info for this request's session
+
+    Sessions created before the token store kept the token in session data;
+    those are moved into the store on first use.
+    """
+    session_key = request.session.session_key
+    token_info = token_store.get(session_key)
+    if token_info is None and session_key:
+        token_info = request.session.get("token_info")
+        if token_info:
+            token_store.set(session_key, token_info)
+    return token_info
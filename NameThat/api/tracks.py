@@ -0,0 +1,162 @@
+"""
+Compact track records
+
+Spotify track objects are normalized once, when they are loaded, into
+immutable Track records with __slots__. Artist, album and album art strings
+are interned, so tracks from the same album or artist share one copy of
+them, and every view serializes tracks through Track.to_dict().
+
+Clients may ask for a subset of the serialized fields (a projection); see
+parse_fields() and spotify_fields().
+"""
+
+import sys
+from typing import Dict, Iterable, Optional, Tuple
+
+SPOTIFY_TRACK_URL = "https://open.spotify.com/track/"
+
+# Serialized field -> Spotify track fields it is built from, in to_dict() order
+TRACK_SOURCE_FIELDS = {
+    "id": ("id",),
+    "name": ("name",),
+    "artists": ("artists(name)",),
+    "album": ("album(name)",),
+    "album_image": ("album(images)",),
+    "preview_url": ("preview_url",),
+    "duration_ms": ("duration_ms",),
+    "popularity": ("popularity",),
+    "spotify_url": ("id",),
+    "has_preview": ("preview_url",),
+}
+
+
+def parse_fields(value: Optional[str], extra: Iterable[str] = ()) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated ?fields= projection into serialized field names
+
+    Returns None (everything) for an empty value. extra names fields an
+    endpoint adds on top of the track's own. Raises ValueError for unknown
+    fields.
+    """
+    if not value:
+        return None
+    allowed = set(TRACK_SOURCE_FIELDS) | set(extra)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def spotify_fields(fields: Optional[Iterable[str]] = None) -> str:
+    """
+    The Spotify `fields` filter for a track that covers the given serialized fields
+
+    Always includes the track ID, so projected tracks can still be told apart.
+    """
+    wanted = {"id"}
+    for name in fields if fields is not None else TRACK_SOURCE_FIELDS:
+        wanted.update(TRACK_SOURCE_FIELDS.get(name, ()))
+    # Merge e.g. album(name) and album(images) into album(name,images)
+    plain, nested = [], {}
+    for source in sorted(wanted):
+        if "(" in source:
+            parent, children = source[:-1].split("(", 1)
+            nested.setdefault(parent, []).append(children)
+        else:
+            plain.append(source)
+    return ",".join(plain + [f"{parent}({','.join(children)})" for parent, children in sorted(nested.items())])
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+class Track:
+    """One normalized, immutable Spotify track."""
+
+    __slots__ = ("id", "name", "artists", "first_artist", "album", "album_image",
+                 "preview_url", "duration_ms", "popularity")
+
+    def __init__(self, id: Optional[str], name: str, artists: str, first_artist: str, album: str,
+                 album_image: Optional[str], preview_url: Optional[str], duration_ms: Optional[int],
+                 popularity: Optional[int]):
+        set_field = object.__setattr__
+        set_field(self, "id", id)
+        set_field(self, "name", name)
+        set_field(self, "artists", _intern(artists))
+        set_field(self, "first_artist", _intern(first_artist))
+        set_field(self, "album", _intern(album))
+        set_field(self, "album_image", _intern(album_image))
+        set_field(self, "preview_url", preview_url)
+        set_field(self, "duration_ms", duration_ms)
+        set_field(self, "popularity", popularity)
+
+    @classmethod
+    def from_spotify(cls, track: Dict) -> "Track":
+        """Build a Track from a Spotify track object (full or fields-filtered)."""
+        artist_names = [artist["name"] for artist in track.get("artists") or []]
+        album = track.get("album") or {}
+        album_images = album.get("images") or []
+        return cls(
+            id=track.get("id"),
+            name=track.get("name", ""),
+            artists=", ".join(artist_names),
+            first_artist=artist_names[0] if artist_names else "",
+            album=album.get("name", ""),
+            album_image=album_images[0]["url"] if album_images else None,
+            preview_url=track.get("preview_url"),
+            duration_ms=track.get("duration_ms"),
+            popularity=track.get("popularity"),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Track is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Track is immutable")
+
+    def __reduce__(self):
+        # Rebuilt through __init__ so strings are re-interned after unpickling
+        return Track, tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, Track):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __hash__(self):
+        return hash((self.id, self.preview_url))
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.name!r})"
+
+    @property
+    def spotify_url(self) -> Optional[str]:
+        return SPOTIFY_TRACK_URL + self.id if self.id else None
+
+    def with_preview(self, preview_url: str) -> "Track":
+        """Return this track with preview_url set (e.g. one found by the preview service)."""
+        if preview_url == self.preview_url:
+            return self
+        values = [getattr(self, field) for field in self.__slots__]
+        values[self.__slots__.index("preview_url")] = preview_url
+        return Track(*values)
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> Dict:
+        """The JSON shape every track-returning endpoint uses, optionally projected to `fields`."""
+        if fields is not None:
+            full = self.to_dict()
+            return {name: full[name] for name in fields if name in full}
+        return {
+            "id": self.id,
+            "name": self.name,
+            "artists": self.artists,
+            "album": self.album,
+            "album_image": self.album_image,
+            "preview_url": self.preview_url,
+            "duration_ms": self.duration_ms,
+            "popularity": self.popularity,
+            "spotify_url": self.spotify_url,
+            "has_preview": bool(self.preview_url),
+        }
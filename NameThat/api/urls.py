@@ -1,12 +1,18 @@
 from django.urls import path
-from .views import get_preview_url_view, login, callback, playlists, test_session, debug_session, random_track_from_playlist
+from .views import get_preview_url_view, get_preview_batch_view, preview_audio, login, callback, playlists, playlist_tracks, track_preview, test_session, debug_session, random_track_from_playlist, start_game, next_game_round
 
 urlpatterns = [
     path('get_preview/', get_preview_url_view, name='get_preview_url'),
+    path('get_preview/batch/', get_preview_batch_view, name='get_preview_batch'),
+    path('preview_audio/<str:preview_id>/', preview_audio, name='preview_audio'),
     path('login/', login, name='login'),
     path('callback/', callback, name='callback'),
     path('playlists/', playlists, name='playlists'),
+    path('playlist/<str:playlist_id>/tracks/', playlist_tracks, name='playlist_tracks'),
+    path('track/<str:track_id>/', track_preview, name='track_preview'),
     path('test_session/', test_session, name='test_session'),
     path('debug_session/', debug_session, name='debug_session'),
     path('random_track_from_playlist/<str:playlist_id>/', random_track_from_playlist, name='random_track_from_playlist'),
+    path('game/start/', start_game, name='start_game'),
+    path('game/<uuid:game_id>/next/', next_game_round, name='next_game_round'),
 ]
@@ -0,0 +1,60 @@
+"""
+Per-user playlist list cache
+
+Spotify pages a user's playlists 50 at a time. The first page is always
+fetched; its total plus the IDs and snapshot_ids on it make up the list's
+signature. While the signature is unchanged (and the entry is younger than
+USER_PLAYLISTS_MAX_AGE) the cached full list is served; otherwise every
+remaining page is fetched concurrently and the list is cached again.
+"""
+
+import hashlib
+import os
+import time
+from typing import Dict, List
+
+from django.core.cache import caches
+
+from .playlist_loader import fetch_all_pages
+
+CACHE_ALIAS = "playlists"
+USER_PLAYLISTS_PAGE_SIZE = 50  # Spotify's maximum for this endpoint
+# Edits to playlists past the first page don't change the signature; this
+# bounds how long those can go unnoticed
+USER_PLAYLISTS_MAX_AGE = int(os.getenv("USER_PLAYLISTS_MAX_AGE", "3600"))
+
+
+def _cache_key(session_key: str) -> str:
+    return f"user-playlists:{session_key}"
+
+
+def _signature(first_page: Dict) -> str:
+    parts = [str(first_page.get("total"))]
+    parts += [f"{p['id']}:{p.get('snapshot_id')}" for p in first_page.get("items") or [] if p]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def get_user_playlists(sp, session_key: str) -> List[Dict]:
+    """
+    Return all of the current user's playlists as {"id", "name"} dicts, in library order
+
+    Args:
+        sp: spotipy client authenticated as the user
+        session_key: The user's session key, which scopes the cache entry
+    """
+    def fetch_page(offset, limit):
+        return sp.current_user_playlists(limit=limit, offset=offset)
+
+    first_page = fetch_page(0, USER_PLAYLISTS_PAGE_SIZE)
+    signature = _signature(first_page)
+
+    cache = caches[CACHE_ALIAS]
+    entry = cache.get(_cache_key(session_key)) if session_key else None
+    if entry and entry["signature"] == signature and time.time() - entry["loaded_at"] < USER_PLAYLISTS_MAX_AGE:
+        return entry["playlists"]
+
+    items = fetch_all_pages(fetch_page, page_size=USER_PLAYLISTS_PAGE_SIZE, first_page=first_page)
+    playlists = [{"id": p["id"], "name": p["name"]} for p in items if p]
+    if session_key:
+        cache.set(_cache_key(session_key), {"signature": signature, "playlists": playlists, "loaded_at": time.time()})
+    return playlists
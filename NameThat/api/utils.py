@@ -1,11 +1,14 @@
 # api/utils.py
 import os
 from spotipy.oauth2 import SpotifyOAuth
+from .spotify_client import get_http_session, SPOTIFY_REQUESTS_TIMEOUT
 
 def get_spotify_oauth():
     return SpotifyOAuth(
         client_id=os.getenv("SPOTIFY_CLIENT_ID"),
         client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
         redirect_uri=os.getenv("SPOTIFY_REDIRECT_URI"),
-        scope="user-read-private user-read-email playlist-read-private playlist-read-collaborative user-library-read"
+        scope="user-read-private user-read-email playlist-read-private playlist-read-collaborative user-library-read",
+        requests_session=get_http_session(),
+        requests_timeout=SPOTIFY_REQUESTS_TIMEOUT
     )
\ No newline at end of file
@@ -1,13 +1,34 @@
 # api/views.py
+from django.conf import settings
 from django.shortcuts import redirect
+from django.urls import reverse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .utils import get_spotify_oauth
-import spotipy
-import random
-import requests
-from django.http import JsonResponse
+from .token_store import token_store
+from .auth import aresolve_access_token, resolve_access_token, token_refresher
+from .spotify_client import get_spotify_client, run_blocking
+from .playlist_cache import aget_playlist_tracks, playlist_snapshot_id, stream_playlist_tracks
+from .playable_index import playable_index
+from .user_playlists import get_user_playlists
+from .preview_service import MAX_BATCH_SIZE, lookup_preview, resolve_previews
+from .game import GAME_DEFAULT_ROUNDS, GAME_MAX_ROUNDS, GameError, game_engine
+from .models import GameSession
+from .audio_cache import get_preview_file, is_valid_preview_id, preview_id_from_url
+from .playlist_loader import TRACK_FIELDS
+from .tracks import Track, parse_fields, spotify_fields
+from .etags import etag_matches, make_etag, not_modified, remember_etag, remembered_etag
+import asyncio
+import base64
+import binascii
+import json
+import mmap
+import os
+import re
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
 
 @api_view(["GET"])
 def debug_session(request):
@@ -57,240 +78,404 @@ def login(request):
 
 @api_view(["GET"])
 def callback(request):
-    """Handle Spotify's redirect back with code, save token into session."""
+    """Handle Spotify's redirect back with code, save token into the token store."""
     code = request.GET.get("code")
     state = request.GET.get("state")  # This should be our session key
     
     # Get the token info
     token_info = get_spotify_oauth().get_access_token(code)
     
-    # Try to restore the original session using the state parameter
-    if state:
-        try:
-            # Create a new session store with the original session key
-            from django.contrib.sessions.backends.db import SessionStore
-            original_session = SessionStore(session_key=state)
-            
-            # Save the token to the original session
-            original_session["token_info"] = token_info
-            original_session.save()
-            
-            # Set this session as the current one
-            request.session = original_session
-            
-        except Exception as e:
-            # Fallback: create new session
-            if not request.session.session_key:
-                request.session.create()
-            request.session["token_info"] = token_info
-            request.session.save()
+    # Prefer the original session named by the state parameter; the token lives
+    # in the token store, so the session row itself doesn't need rewriting
+    if state and request.session.exists(state):
+        session_key = state
     else:
-        # No state parameter, create new session
         if not request.session.session_key:
             request.session.create()
-        request.session["token_info"] = token_info
-        request.session.save()
+        session_key = request.session.session_key
+    token_store.set(session_key, token_info)
+    token_refresher.track(session_key, token_info)
     
     # Redirect back to the frontend
-    return redirect("http://localhost:3000/")
+    response = redirect("http://localhost:3000/")
+    if session_key != request.session.session_key:
+        # Point the browser at the original session
+        response.set_cookie(
+            settings.SESSION_COOKIE_NAME,
+            session_key,
+            max_age=settings.SESSION_COOKIE_AGE,
+            domain=settings.SESSION_COOKIE_DOMAIN,
+            path=settings.SESSION_COOKIE_PATH,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=settings.SESSION_COOKIE_HTTPONLY,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+    return response
 
-@api_view(["GET"])
-def playlists(request):
-    """Return simple list of current user's playlists, refreshing token if needed."""
-    token_info = request.session.get("token_info")
-    if not token_info:
-        return Response({"error": "not authenticated"}, status=401)
+async def _remembered_not_modified(request, memo_key):
+    """A 304 if If-None-Match matches the ETag last served for memo_key, else None."""
+    if not request.headers.get("If-None-Match"):
+        return None
+    etag = await run_blocking(remembered_etag, memo_key)
+    return not_modified(etag) if etag_matches(request, etag) else None
 
-    oauth = get_spotify_oauth()
+async def _conditional(request, response, memo_key, etag):
+    """Tag a response with its ETag (remembering it), or answer 304 if the client has it."""
+    await run_blocking(remember_etag, memo_key, etag)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response["ETag"] = etag
+    return response
 
-    # If token expired, refresh it
-    if oauth.is_token_expired(token_info):
-        token_info = oauth.refresh_access_token(token_info["refresh_token"])
-        request.session["token_info"] = token_info
+PLAYLISTS_DEFAULT_LIMIT = 50
+PLAYLISTS_MAX_LIMIT = 200
 
-    sp = spotipy.Spotify(auth=token_info["access_token"])
-    items = sp.current_user_playlists(limit=50)["items"]
-    data = [{"id": p["id"], "name": p["name"]} for p in items]
-    return Response(data)
+def _encode_cursor(offset):
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip("=")
 
-@api_view(["GET"])
-def playlist_tracks(request, playlist_id):
-    token = request.session.get("token_info", {}).get("access_token")
+def _decode_cursor(cursor):
+    """Offset encoded in a cursor; raises ValueError if it isn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not raw.startswith("o:") or not raw[2:].isdigit():
+        raise ValueError("Invalid cursor")
+    return int(raw[2:])
+
+@require_GET
+async def playlists(request):
+    """
+    Return all of the current user's playlists, refreshing token if needed
+    
+    Without parameters the whole list is returned, as a JSON array. With
+    ?limit= (and then ?cursor= from the previous page) it is paginated:
+    {"items": [...], "total": n, "next_cursor": "..." or null}.
+    """
+    # Refreshed first if expired (one refresh shared by concurrent requests)
+    token = await aresolve_access_token(request)
     if not token:
-        return Response({"error": "not authenticated"}, status=401)
+        return JsonResponse({"error": "not authenticated"}, status=401)
+    
+    paginated = "limit" in request.GET or "cursor" in request.GET
+    try:
+        limit = int(request.GET.get("limit", PLAYLISTS_DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    try:
+        offset = _decode_cursor(request.GET["cursor"]) if request.GET.get("cursor") else 0
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if not 1 <= limit <= PLAYLISTS_MAX_LIMIT:
+        return JsonResponse({"error": f"limit must be between 1 and {PLAYLISTS_MAX_LIMIT}"}, status=400)
+    
+    memo_key = f"playlists:{request.session.session_key}:{limit if paginated else ''}:{offset}"
+    cached = await _remembered_not_modified(request, memo_key)
+    if cached:
+        return cached
+
+    sp = get_spotify_client(token)
+    # Every page fetched concurrently, cached per user until the list changes
+    items = await run_blocking(get_user_playlists, sp, request.session.session_key)
+    if paginated:
+        end = offset + limit
+        data = {
+            "items": items[offset:end],
+            "total": len(items),
+            "next_cursor": _encode_cursor(end) if end < len(items) else None
+        }
+    else:
+        data = items
+    body = json.dumps(data)
+    return await _conditional(request, HttpResponse(body, content_type="application/json"),
+                              memo_key, make_etag("playlists", body))
+
+PLAYLIST_META_FIELDS = "name,description,images,owner(display_name)"
+
+def _playlist_data(playlist_id, playlist_info):
+    return {
+        "id": playlist_id,
+        "name": playlist_info["name"],
+        "description": playlist_info.get("description", ""),
+        "owner": playlist_info.get("owner", {}).get("display_name", ""),
+        "image": playlist_info.get("images", [{}])[0].get("url") if playlist_info.get("images") else None
+    }
+
+def _streaming_response(request, lines, content_type):
+    """
+    Stream a blocking iterator of lines under either server
+    
+    Django buffers the whole body when a sync iterator is served over ASGI
+    (or an async one over WSGI, e.g. runserver), so under ASGI the iterator
+    is stepped on the shared pool from an async generator instead.
+    """
+    if isinstance(request, ASGIRequest):
+        lines = _aiter_blocking(lines)
+    return StreamingHttpResponse(lines, content_type=content_type)
+
+async def _aiter_blocking(iterator):
+    done = object()
+    try:
+        while True:
+            item = await run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        # A dropped client stops the underlying generator (and its page fetches) too
+        close = getattr(iterator, "close", None)
+        if close:
+            await run_blocking(close)
+
+def _track_summary(total, with_preview):
+    return {
+        "total_tracks": total,
+        "tracks_with_preview": with_preview,
+        "tracks_without_preview": total - with_preview
+    }
+
+@require_GET
+async def playlist_tracks(request, playlist_id):
+    """
+    Return a playlist and all of its tracks
+    
+    With ?stream=1 the response is NDJSON instead: a {"playlist": ...} line,
+    one {"track": ...} line per track as pages arrive from Spotify, and a
+    {"summary": ...} trailer with the preview counts. Streamed responses
+    carry no ETag, since a stream that fails partway still ends in a 200.
     
+    ?fields=id,preview_url,... trims each track to those fields, and only
+    they are requested from Spotify.
+    """
+    token = await aresolve_access_token(request)
+    if not token:
+        return JsonResponse({"error": "not authenticated"}, status=401)
     try:
-        sp = spotipy.Spotify(auth=token)
+        fields = parse_fields(request.GET.get("fields"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    # preview_url is always needed for the preview counts
+    track_fields = f"track({spotify_fields(fields + ('has_preview',))})" if fields else TRACK_FIELDS
+    
+    if request.GET.get("stream") == "1":
+        try:
+            playlist_info, chunks = await run_blocking(
+                stream_playlist_tracks, get_spotify_client(token), playlist_id,
+                meta_fields=PLAYLIST_META_FIELDS, track_fields=track_fields
+            )
+        except Exception as e:
+            return JsonResponse({"error": f"Failed to get playlist tracks: {str(e)}"}, status=400)
+        return _streaming_response(
+            request, _stream_tracks(_playlist_data(playlist_id, playlist_info), chunks, fields),
+            "application/x-ndjson"
+        )
+    
+    # The ETag is the snapshot_id plus the representation; a revisit is answered
+    # from the remembered ETag, or else from one snapshot_id check (none at all
+    # for playlists in the shared catalog) without loading any tracks
+    variant = ("json", ",".join(fields or ()))
+    memo_key = f"playlist-tracks:{request.session.session_key}:{playlist_id}:{':'.join(variant)}"
+    cached = await _remembered_not_modified(request, memo_key)
+    if cached:
+        return cached
+    
+    try:
+        sp = get_spotify_client(token)
         
-        # Get playlist details first
-        playlist_info = sp.playlist(playlist_id, fields="name,description,images,owner(display_name)")
+        if request.headers.get("If-None-Match"):
+            snapshot_id = await run_blocking(playlist_snapshot_id, sp, playlist_id)
+            etag = make_etag(playlist_id, snapshot_id, *variant)
+            if snapshot_id and etag_matches(request, etag):
+                await run_blocking(remember_etag, memo_key, etag)
+                return not_modified(etag)
         
-        # Get all tracks from the playlist
-        # Using fields parameter to get detailed track information
-        fields = "items(track(id,name,artists,album(name,images),preview_url,duration_ms,popularity,external_urls))"
-        tracks_response = sp.playlist_tracks(playlist_id, fields=fields, limit=100)
+        # Get playlist details and all of its tracks (cached until the playlist's
+        # snapshot_id changes; fetched concurrently when nothing is cached)
+        playlist_info, playlist_items = await aget_playlist_tracks(
+            sp, playlist_id, meta_fields=PLAYLIST_META_FIELDS, track_fields=track_fields
+        )
         
-        tracks = []
-        for item in tracks_response["items"]:
-            track = item["track"]
-            if track:  # Skip null tracks
-                # Extract artist names
-                artists = [artist["name"] for artist in track.get("artists", [])]
-                artist_names = ", ".join(artists)
-                
-                # Get album image (first image if available)
-                album_images = track.get("album", {}).get("images", [])
-                album_image = album_images[0]["url"] if album_images else None
-                
-                track_info = {
-                    "id": track["id"],
-                    "name": track["name"],
-                    "artists": artist_names,
-                    "album": track.get("album", {}).get("name", ""),
-                    "album_image": album_image,
-                    "preview_url": track.get("preview_url"),
-                    "duration_ms": track.get("duration_ms"),
-                    "popularity": track.get("popularity"),
-                    "spotify_url": track.get("external_urls", {}).get("spotify"),
-                    "has_preview": bool(track.get("preview_url"))
-                }
-                tracks.append(track_info)
+        tracks = [track.to_dict(fields) for track in playlist_items]
+        with_preview = sum(1 for track in playlist_items if track.preview_url)
         
-        return Response({
-            "playlist": {
-                "id": playlist_id,
-                "name": playlist_info["name"],
-                "description": playlist_info.get("description", ""),
-                "owner": playlist_info.get("owner", {}).get("display_name", ""),
-                "image": playlist_info.get("images", [{}])[0].get("url") if playlist_info.get("images") else None
-            },
+        response = JsonResponse({
+            "playlist": _playlist_data(playlist_id, playlist_info),
             "tracks": tracks,
-            "total_tracks": len(tracks),
-            "tracks_with_preview": len([t for t in tracks if t["has_preview"]]),
-            "tracks_without_preview": len([t for t in tracks if not t["has_preview"]])
+            **_track_summary(len(tracks), with_preview)
         })
+        if not playlist_info.get("snapshot_id"):
+            return response
+        return await _conditional(request, response, memo_key,
+                                  make_etag(playlist_id, playlist_info["snapshot_id"], *variant))
         
     except Exception as e:
-        return Response({"error": f"Failed to get playlist tracks: {str(e)}"}, status=400)
+        return JsonResponse({"error": f"Failed to get playlist tracks: {str(e)}"}, status=400)
 
-@api_view(["GET"])
-def track_preview(request, track_id):
-    """Get a single track with its preview URL for audio playback."""
-    token = request.session.get("token_info", {}).get("access_token")
+def _stream_tracks(playlist, chunks, fields=None):
+    yield json.dumps({"playlist": playlist}) + "\n"
+    total = with_preview = 0
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            with_preview += sum(1 for track in chunk if track.preview_url)
+            yield "".join(json.dumps({"track": track.to_dict(fields)}) + "\n" for track in chunk)
+    except Exception as e:
+        # Headers are already sent; report the failure in-band and stop
+        yield json.dumps({"error": f"Failed to get playlist tracks: {str(e)}"}) + "\n"
+        return
+    yield json.dumps({"summary": _track_summary(total, with_preview)}) + "\n"
+
+@require_GET
+async def track_preview(request, track_id):
+    """
+    Get a single track with its preview URL for audio playback
+    
+    ?fields= trims the response like playlist_tracks (audio_features is one
+    more field here, and is only fetched when asked for).
+    """
+    token = await aresolve_access_token(request)
     if not token:
-        return Response({"error": "not authenticated"}, status=401)
+        return JsonResponse({"error": "not authenticated"}, status=401)
+    try:
+        fields = parse_fields(request.GET.get("fields"), extra=("audio_features",))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    want_features = fields is None or "audio_features" in fields
+    memo_key = f"track:{track_id}:{','.join(fields or ())}"
+    cached = await _remembered_not_modified(request, memo_key)
+    if cached:
+        return cached
     
     try:
-        sp = spotipy.Spotify(auth=token)
+        sp = get_spotify_client(token)
         
-        # Get track details
-        track = sp.track(track_id)
+        # Get track details and audio features concurrently; features are optional
+        track, features = await asyncio.gather(
+            run_blocking(sp.track, track_id),
+            run_blocking(sp.audio_features, [track_id]) if want_features else asyncio.sleep(0),
+            return_exceptions=True
+        )
+        if isinstance(track, Exception):
+            raise track
         
-        # Extract artist names
-        artists = [artist["name"] for artist in track.get("artists", [])]
-        artist_names = ", ".join(artists)
+        track_info = Track.from_spotify(track).to_dict(fields)
+        if want_features:
+            track_info["audio_features"] = None
         
-        # Get album image
-        album_images = track.get("album", {}).get("images", [])
-        album_image = album_images[0]["url"] if album_images else None
+        # Attach audio features if available
+        features = features[0] if isinstance(features, list) and features else None
+        if features:
+            track_info["audio_features"] = {
+                "tempo": features.get("tempo"),
+                "key": features.get("key"),
+                "mode": features.get("mode"),
+                "danceability": features.get("danceability"),
+                "energy": features.get("energy"),
+                "valence": features.get("valence")
+            }
         
-        track_info = {
-            "id": track["id"],
-            "name": track["name"],
-            "artists": artist_names,
-            "album": track.get("album", {}).get("name", ""),
-            "album_image": album_image,
-            "preview_url": track.get("preview_url"),
-            "duration_ms": track.get("duration_ms"),
-            "popularity": track.get("popularity"),
-            "spotify_url": track.get("external_urls", {}).get("spotify"),
-            "has_preview": bool(track.get("preview_url")),
-            "audio_features": None
-        }
-        
-        # Get audio features if available
-        try:
-            features = sp.audio_features([track_id])[0]
-            if features:
-                track_info["audio_features"] = {
-                    "tempo": features.get("tempo"),
-                    "key": features.get("key"),
-                    "mode": features.get("mode"),
-                    "danceability": features.get("danceability"),
-                    "energy": features.get("energy"),
-                    "valence": features.get("valence")
-                }
-        except:
-            pass  # Audio features not available
-        
-        return Response(track_info)
+        body = json.dumps(track_info)
+        return await _conditional(request, HttpResponse(body, content_type="application/json"),
+                                  memo_key, make_etag("track", body))
         
     except Exception as e:
-        return Response({"error": f"Failed to get track: {str(e)}"}, status=400)
+        return JsonResponse({"error": f"Failed to get track: {str(e)}"}, status=400)
 
-@api_view(["GET"])
-def random_track_from_playlist(request, playlist_id):
+@require_GET
+async def random_track_from_playlist(request, playlist_id):
     """Get a random track from a playlist for guessing games, using Node.js preview service if needed."""
-    token = request.session.get("token_info", {}).get("access_token")
+    token = await aresolve_access_token(request)
     if not token:
-        return Response({"error": "not authenticated"}, status=401)
+        return JsonResponse({"error": "not authenticated"}, status=401)
     
     try:
-        sp = spotipy.Spotify(auth=token)
-        # Get all tracks from the playlist
-        fields = "items(track(id,name,artists,album(name,images),preview_url,duration_ms,popularity,external_urls))"
-        tracks_response = sp.playlist_tracks(playlist_id, fields=fields, limit=100)
-        
-        # Filter out null tracks
-        valid_tracks = [item["track"] for item in tracks_response["items"] if item["track"]]
-        if not valid_tracks:
-            return Response({"error": "No tracks found in this playlist"}, status=404)
-        
-        # Shuffle tracks to randomize selection
-        random.shuffle(valid_tracks)
+        sp = get_spotify_client(token)
+        # Draw from the playlist's index of tracks with known previews; tracks
+        # without a Spotify preview are resolved via the Node.js service in the background
+        index = await run_blocking(playable_index.get, sp, playlist_id)
+        if not index.track_count:
+            return JsonResponse({"error": "No tracks found in this playlist"}, status=404)
         
-        # Try to find a track with a preview (Spotify or Node)
-        for track in valid_tracks:
-            preview_url = track.get("preview_url")
-            # If no Spotify preview, try Node.js service
-            if not preview_url:
-                track_name = track.get("name", "")
-                artists = track.get("artists", [])
-                artist_name = artists[0]["name"] if artists else ""
-                try:
-                    resp = requests.get(
-                        "http://localhost:3001/preview",
-                        params={"track": track_name, "artist": artist_name},
-                        timeout=5
-                    )
-                    data = resp.json()
-                    preview_url = data.get("preview")
-                except Exception:
-                    preview_url = None
-            if preview_url:
-                # Extract artist names
-                artists = [artist["name"] for artist in track.get("artists", [])]
-                artist_names = ", ".join(artists)
-                # Get album image
-                album_images = track.get("album", {}).get("images", [])
-                album_image = album_images[0]["url"] if album_images else None
-                track_info = {
-                    "id": track["id"],
-                    "name": track["name"],
-                    "artists": artist_names,
-                    "album": track.get("album", {}).get("name", ""),
-                    "album_image": album_image,
-                    "preview_url": preview_url,
-                    "duration_ms": track.get("duration_ms"),
-                    "popularity": track.get("popularity"),
-                    "spotify_url": track.get("external_urls", {}).get("spotify"),
-                    "has_preview": True
-                }
-                return Response(track_info)
+        track = index.random_track()
+        if track:
+            return JsonResponse(track.to_dict())
         # If no track with any preview found
-        return Response({"error": "No tracks with preview available in this playlist (Spotify or Node)"}, status=404)
+        return JsonResponse({"error": "No tracks with preview available in this playlist (Spotify or Node)"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": f"Failed to get random track: {str(e)}"}, status=400)
+
+def _round_data(game, game_round):
+    # Rounds on Spotify's CDN can be played through the local byte cache
+    preview_id = preview_id_from_url(game_round.preview_url)
+    return {
+        "game_id": str(game.id),
+        "round_number": game_round.round_number,
+        "total_rounds": game.total_rounds,
+        "track": {
+            "id": game_round.track_id,
+            "name": game_round.track_name,
+            "artists": game_round.artist_name,
+            "album": game_round.album_name,
+            "album_image": game_round.album_image or None,
+            "preview_url": game_round.preview_url,
+            "proxy_url": reverse("preview_audio", args=[preview_id]) if preview_id else None,
+        }
+    }
+
+@api_view(["POST"])
+def start_game(request):
+    """
+    Start a game on a playlist (or on Liked Songs, with playlist_id "liked")
+    
+    Rounds are pre-generated and prefetched server-side.
+    """
+    token = resolve_access_token(request)
+    if not token:
+        return Response({"error": "not authenticated"}, status=401)
+    
+    playlist_id = request.data.get("playlist_id")
+    if not playlist_id:
+        return Response({"error": "Missing playlist_id"}, status=400)
+    try:
+        rounds = int(request.data.get("rounds", GAME_DEFAULT_ROUNDS))
+    except (TypeError, ValueError):
+        return Response({"error": "rounds must be a number"}, status=400)
+    rounds = max(1, min(rounds, GAME_MAX_ROUNDS))
+    
+    try:
+        sp = get_spotify_client(token)
+        game = game_engine.start_game(sp, request.session.session_key, playlist_id, rounds)
+    except GameError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        return Response({"error": f"Failed to start game: {str(e)}"}, status=400)
+    
+    return Response({
+        "game_id": str(game.id),
+        "playlist_id": game.playlist_id,
+        "playlist_name": game.playlist_name,
+        "total_rounds": game.total_rounds
+    }, status=201)
+
+@api_view(["POST"])
+def next_game_round(request, game_id):
+    """Advance a game to its next round; the round is normally already resolved."""
+    token = resolve_access_token(request)
+    if not token:
+        return Response({"error": "not authenticated"}, status=401)
+    
+    game = GameSession.objects.filter(id=game_id, session_key=request.session.session_key).first()
+    if game is None:
+        return Response({"error": "Game not found"}, status=404)
+    
+    try:
+        game_round = game_engine.next_round(get_spotify_client(token), game)
+    except GameError as e:
+        return Response({"error": str(e)}, status=e.status)
     except Exception as e:
-        return Response({"error": f"Failed to get random track: {str(e)}"}, status=400)
+        return Response({"error": f"Failed to get next round: {str(e)}"}, status=400)
+    
+    return Response(_round_data(game, game_round))
 
 @csrf_exempt
 def get_preview_url_view(request):
@@ -299,11 +484,133 @@ def get_preview_url_view(request):
     if not track or not artist:
         return JsonResponse({'error': 'Missing track or artist'}, status=400)
     try:
-        resp = requests.get('http://localhost:3001/preview', params={'track': track, 'artist': artist}, timeout=5)
-        data = resp.json()
-        if 'preview' in data and data['preview']:
-            return JsonResponse({'preview': data['preview']})
+        preview = lookup_preview(track, artist)
+        if preview:
+            return JsonResponse({'preview': preview})
         else:
             return JsonResponse({'error': 'No preview found'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+async def get_preview_batch_view(request):
+    """
+    Resolve many track/artist pairs in one call, streaming NDJSON results as they complete
+    
+    Under ASGI the lookups are stepped on the shared pool, so each line is sent
+    as soon as it resolves rather than after the whole batch.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        items = json.loads(request.body or b'{}').get('items')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'Expected a non-empty items list'}, status=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'At most {MAX_BATCH_SIZE} items per batch'}, status=400)
+    
+    pairs = []
+    for item in items:
+        track = item.get('track') if isinstance(item, dict) else None
+        artist = item.get('artist') if isinstance(item, dict) else None
+        if not track or not artist:
+            return JsonResponse({'error': 'Missing track or artist'}, status=400)
+        pairs.append((track, artist))
+    
+    def stream():
+        # One line per item, in completion order; "index" points back into items
+        for index, preview in resolve_previews(pairs):
+            track, artist = pairs[index]
+            yield json.dumps({'index': index, 'track': track, 'artist': artist, 'preview': preview}) + '\n'
+    
+    return _streaming_response(request, stream(), 'application/x-ndjson')
+
+_BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _parse_byte_range(header, size):
+    """
+    Parse a single-range Range header against a file of `size` bytes
+    
+    Returns (start, end) inclusive, False if the range can't be satisfied,
+    or None if the header should be ignored (malformed or multi-range).
+    """
+    match = _BYTE_RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length or not size:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+@require_http_methods(["GET", "HEAD"])
+async def preview_audio(request, preview_id):
+    """
+    Serve a preview MP3 through the local byte cache, with Range and ETag support
+    
+    Only logged-in users can fill the cache from the CDN. Downloads and file
+    reads run on the shared pool, so a first-time download never holds up
+    other requests.
+    """
+    if not is_valid_preview_id(preview_id):
+        return JsonResponse({'error': 'Invalid preview id'}, status=404)
+    if not await aresolve_access_token(request):
+        return JsonResponse({'error': 'not authenticated'}, status=401)
+    
+    # A preview ID always names the same bytes, so it makes a strong ETag
+    etag = f'"{preview_id}"'
+    if_none_match = request.headers.get('If-None-Match', '')
+    if if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+    return await run_blocking(_preview_file_response, request, preview_id, etag)
+
+def _preview_file_response(request, preview_id, etag):
+    try:
+        path = get_preview_file(preview_id)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            # Evicted between lookup and open
+            f = open(get_preview_file(preview_id), 'rb')
+    except Exception as e:
+        return JsonResponse({'error': f'Failed to fetch preview: {str(e)}'}, status=502)
+    
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        start, end, status = 0, size - 1, 200
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (not if_range or if_range.strip() == etag):
+            byte_range = _parse_byte_range(range_header, size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                response['ETag'] = etag
+                return response
+            if byte_range:
+                start, end = byte_range
+                status = 206
+        
+        body = b''
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                body = mm[start:end + 1]
+    
+    response = HttpResponse(body, status=status, content_type='audio/mpeg')
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
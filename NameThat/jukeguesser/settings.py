@@ -72,9 +72,11 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'if-none-match',
 ]
 CORS_EXPOSE_HEADERS = [
     'set-cookie',
+    'etag',
 ]
 SESSION_COOKIE_SAMESITE = "Lax"  # Changed from "None" for better localhost compatibility
 SESSION_COOKIE_SECURE = False
@@ -84,7 +86,10 @@ SESSION_COOKIE_PATH = "/"
 CSRF_COOKIE_SAMESITE = "Lax"  # Changed from "None" for better localhost compatibility
 CSRF_COOKIE_SECURE = False
 CSRF_COOKIE_HTTPONLY = False
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Sessions are read through the shared "sessions" cache and only written to the
+# database when they change; Spotify tokens live in api.token_store, not the session
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
 
 ROOT_URLCONF = 'jukeguesser.urls'
 
@@ -117,6 +122,44 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# "playlists" holds playlist track lists keyed by Spotify snapshot_id, on disk
+# so they survive restarts. "sessions" backs the session engine and the
+# Spotify token store.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'playlists': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'playlist_cache',
+        'TIMEOUT': int(os.getenv('PLAYLIST_CACHE_TIMEOUT', 7 * 24 * 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Shared by all worker processes: session data and Spotify tokens
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'session_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Spotify API response bodies kept for ETag revalidation (see api/http_cache.py)
+    'spotify_http': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'spotify_http_cache',
+        'TIMEOUT': int(os.getenv('SPOTIFY_HTTP_CACHE_TIMEOUT', 24 * 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -157,6 +200,10 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Preview MP3s proxied through /api/preview_audio/, cached on disk
+PREVIEW_AUDIO_CACHE_DIR = BASE_DIR / 'preview_audio_cache'
+PREVIEW_AUDIO_CACHE_MAX_BYTES = int(os.getenv('PREVIEW_AUDIO_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 